@@ -0,0 +1,187 @@
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from api.db import get_conn, prepare_flag
+from api.owid import snapshot_version
+from api.formats import choose_encoding, compress
+from api.metrics import phase, degraded
+
+# Responses are cached per (route, params, data version); the DB part of the version is
+# re-read at most every DATA_VERSION_CHECK_SECONDS, so a 304 normally needs no DB access.
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_MB", "64")) * 1024 * 1024
+RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "60"))
+DATA_VERSION_CHECK_SECONDS = float(os.getenv("DATA_VERSION_CHECK_SECONDS", "10"))
+
+# Live/operational routes are never cached; exports are streamed, not buffered
+UNCACHED_PREFIXES = (
+    "/health", "/metrics", "/meta/pool", "/meta/owid-snapshot", "/meta/data-version", "/export/",
+    "/docs", "/redoc", "/openapi.json",
+)
+
+_db_version = {"value": None, "checked": None}
+_version_lock = asyncio.Lock()
+
+
+async def db_data_version():
+    """
+    Counter bumped by every ingestion run (data_version table), or None when unreadable.
+    """
+    checked = _db_version["checked"]
+    if checked is not None and time.time() - checked < DATA_VERSION_CHECK_SECONDS:
+        return _db_version["value"]
+
+    async with _version_lock:
+        checked = _db_version["checked"]
+        if checked is None or time.time() - checked >= DATA_VERSION_CHECK_SECONDS:
+            try:
+                async with get_conn() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute("SELECT version FROM data_version;", prepare=prepare_flag())
+                        row = await cur.fetchone()
+                _db_version["value"] = row[0] if row else None
+            except Exception:
+                _db_version["value"] = None
+            _db_version["checked"] = time.time()
+    return _db_version["value"]
+
+
+async def data_version():
+    """Token covering everything responses are derived from: DB ingestion counter + OWID snapshot."""
+    return f"{await db_data_version()}-{snapshot_version()}"
+
+
+class ResponseCache:
+    """
+    LRU of encoded response bodies, bounded by total body size.
+    Entries are keyed by (path, query, Accept, content encoding) and tagged with the
+    data version they were rendered under; a version change makes them misses.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, version, body: bytes, media_type: str, encoding=None):
+        if len(body) > self.max_bytes:
+            return
+        self.pop(key)
+        self._entries[key] = (version, body, media_type, encoding)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, old, _, _) = self._entries.popitem(last=False)
+            self.size -= len(old)
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
+
+
+def _etag(key, version):
+    digest = hashlib.sha1(repr((key, version)).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _if_none_match(request: Request, etag: str):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _encoded_headers(headers, encoding):
+    if encoding is None:
+        return headers
+    return {**headers, "Content-Encoding": encoding}
+
+
+async def cache_responses(request: Request, call_next):
+    """
+    HTTP middleware: ETag/Cache-Control on GET responses, 304 on a matching If-None-Match,
+    and cached bodies served without running the endpoint. Bodies are compressed
+    (brotli/gzip per Accept-Encoding) once, before they are cached.
+    """
+    if request.method != "GET" or request.url.path.startswith(UNCACHED_PREFIXES):
+        return await call_next(request)
+
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    key = (
+        request.url.path,
+        tuple(sorted(request.query_params.multi_items())),
+        request.headers.get("accept", ""),
+        encoding,
+    )
+    version = await data_version()
+    etag = _etag(key, version)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={RESPONSE_CACHE_MAX_AGE}",
+        "Vary": "Accept, Accept-Encoding",
+    }
+
+    if _if_none_match(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    entry = response_cache.get(key, version)
+    if entry is not None:
+        _, body, media_type, applied = entry
+        return Response(content=body, media_type=media_type, headers={**_encoded_headers(headers, applied), "X-Cache": "hit"})
+
+    response = await call_next(request)
+    if degraded():
+        # OWID fallback during a DB outage: the version (and so the ETag) doesn't describe
+        # it, and it must not outlive the outage in this cache or the client's
+        response.headers["Cache-Control"] = "no-store"
+        return response
+    if response.status_code != 200:
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    media_type = response.headers.get("content-type")
+    with phase("compress"):
+        body, applied = compress(body, encoding)
+    # The data may have moved on while the endpoint ran; only cache under an unchanged version
+    if version == await data_version():
+        response_cache.put(key, version, body, media_type, applied)
+
+    passthrough = {
+        k: v for k, v in response.headers.items()
+        if k.lower() not in ("content-length", "content-type", "content-encoding", "vary")
+    }
+    return Response(
+        content=body,
+        status_code=200,
+        media_type=media_type,
+        headers={**passthrough, **_encoded_headers(headers, applied), "X-Cache": "miss"},
+    )
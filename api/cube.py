@@ -0,0 +1,206 @@
+import os
+import time
+import asyncio
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from api.db import get_conn, prepare_flag
+from api.owid import fetch_owid_store, current_store, snapshot_version, mom_growth
+
+# How often the DB data version is re-read (seconds); a failed read is not retried sooner
+DB_CUBE_CHECK_SECONDS = float(os.getenv("DB_CUBE_CHECK_SECONDS", "60"))
+
+METRICS = ("latest_total_vaccinations", "latest_mom_growth_rate")
+
+
+class WorldCube:
+    """
+    Precomputed country x month table of month-end total vaccinations and MoM growth.
+
+    Both matrices are forward-filled along the month axis, so the value "as of" any
+    month is a single column read: the latest observed month-end total, and the latest
+    month that has a growth rate, at or before that month.
+    """
+
+    def __init__(self, countries, iso_codes, months, totals, growth, source, version, is_country=None):
+        self.countries = countries
+        self.iso_codes = iso_codes
+        self.months = months
+        self.totals = totals
+        self.growth = growth
+        self.source = source
+        self.version = version
+        if is_country is None:
+            # OWID aggregates (World, continents, income groups) have OWID_* or no iso code
+            is_country = np.array(
+                [iso is not None and not iso.startswith("OWID") for iso in iso_codes], dtype=bool
+            )
+        self.is_country = is_country
+
+    @classmethod
+    def build(cls, countries, iso_codes, codes, months, totals, growth, source, version, is_country=None):
+        """
+        `codes`/`months`/`totals`/`growth` are the sparse month-end rows
+        (as returned by OwidStore.month_end), sorted by (code, month).
+        """
+        months = months.astype("datetime64[M]")
+        if len(months):
+            axis = np.arange(months.min(), months.max() + 1)
+        else:
+            axis = np.array([], dtype="datetime64[M]")
+        shape = (len(countries), len(axis))
+        col = (months - axis[0]).astype(np.int64) if len(axis) else np.array([], dtype=np.int64)
+
+        dense_totals = np.full(shape, np.nan)
+        dense_totals[codes, col] = totals
+        dense_growth = np.full(shape, np.nan)
+        dense_growth[codes, col] = growth
+
+        return cls(
+            countries=np.asarray(countries, dtype=object),
+            iso_codes=np.asarray(iso_codes, dtype=object),
+            months=axis,
+            totals=_ffill(dense_totals),
+            growth=_ffill(dense_growth),
+            source=source,
+            version=version,
+            is_country=is_country,
+        )
+
+    def lookup_columns(self, metric: str, as_of=None):
+        """
+        {"country", "iso_code", "value"} columns for `metric` as of the month containing
+        `as_of` (latest month when None); aggregates and missing values are dropped.
+        """
+        values = self.totals if metric == "latest_total_vaccinations" else self.growth
+        j = len(self.months) - 1
+        if as_of is not None and len(self.months):
+            j = int(np.searchsorted(self.months, np.datetime64(as_of, "M"), side="right")) - 1
+        if j < 0:
+            return {"country": [], "iso_code": [], "value": np.array([], dtype=np.float64)}
+
+        column = values[:, j]
+        rows = np.flatnonzero(~np.isnan(column) & self.is_country)
+        return {
+            "country": self.countries[rows].tolist(),
+            "iso_code": self.iso_codes[rows].tolist(),
+            "value": column[rows],
+        }
+
+    def lookup(self, metric: str, as_of=None):
+        """[{"country", "iso_code", "value"}] rows of lookup_columns."""
+        cols = self.lookup_columns(metric, as_of)
+        return [
+            {"country": str(c), "iso_code": iso, "value": float(v)}
+            for c, iso, v in zip(cols["country"], cols["iso_code"], cols["value"])
+        ]
+
+
+def _ffill(matrix):
+    # Forward-fill NaNs along the month axis
+    if matrix.size == 0:
+        return matrix
+    idx = np.where(~np.isnan(matrix), np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return matrix[np.arange(matrix.shape[0])[:, None], idx]
+
+
+def cube_from_owid(store, version):
+    codes, months, totals, growth = store.month_end()
+    return WorldCube.build(store.locations, store.iso_codes, codes, months, totals, growth, "owid", version)
+
+
+def cube_from_db_rows(rows, iso_lookup, version):
+    """
+    `rows` are (country, month, month_end_total) ordered by country, month, countries only.
+    iso codes are not stored in the DB, so they are borrowed from the OWID snapshot when available.
+    """
+    countries = sorted({r[0] for r in rows})
+    index = {c: i for i, c in enumerate(countries)}
+    codes = np.array([index[r[0]] for r in rows], dtype=np.int64)
+    months = np.array([r[1] for r in rows], dtype="datetime64[M]")
+    totals = np.array([r[2] for r in rows], dtype=np.float64)
+    iso_codes = [iso_lookup.get(c) for c in countries]
+    # Aggregates are already filtered out in SQL (non_country_location); without an iso
+    # lookup the remaining locations are all kept, just without iso codes
+    is_country = None if iso_lookup else np.ones(len(countries), dtype=bool)
+    return WorldCube.build(
+        countries, iso_codes, codes, months, totals, mom_growth(codes, totals), "db", version, is_country
+    )
+
+
+# -------------------------
+# Per-source cache (rebuilt once per data version)
+# -------------------------
+_cubes = {"owid": None, "db": None, "db_checked": None, "db_error": None}
+_build_lock = asyncio.Lock()
+
+
+async def get_owid_cube():
+    store = await fetch_owid_store()
+    version = snapshot_version()
+    cube = _cubes["owid"]
+    if cube is not None and cube.version == version:
+        return cube
+    async with _build_lock:
+        cube = _cubes["owid"]
+        if cube is None or cube.version != version:
+            cube = await run_in_threadpool(cube_from_owid, store, version)
+            _cubes["owid"] = cube
+    return cube
+
+
+def _owid_iso_lookup():
+    store = current_store()
+    if store is None:
+        return {}
+    return dict(zip(store.countries(), store.iso_codes))
+
+
+def _db_cube_checked():
+    checked = _cubes["db_checked"]
+    return checked is not None and time.time() - checked < DB_CUBE_CHECK_SECONDS
+
+
+async def _load_db_cube(current):
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            # Ingestion bumps data_version whenever it changes the data
+            await cur.execute("SELECT version FROM data_version;", prepare=prepare_flag())
+            row = await cur.fetchone()
+            version = (row[0] if row else None, snapshot_version())
+            if current is not None and current.version == version:
+                return current
+            await cur.execute("""
+                SELECT s.country_name, s.month, s.month_end_total_vaccinations
+                FROM country_monthly_summary s
+                WHERE s.month_end_total_vaccinations IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM non_country_location n WHERE n.country_name = s.country_name)
+                ORDER BY 1, 2;
+            """)
+            rows = await cur.fetchall()
+    if not rows:
+        return None
+    return await run_in_threadpool(cube_from_db_rows, rows, _owid_iso_lookup(), version)
+
+
+async def get_db_cube():
+    """
+    DB-backed cube (from country_monthly_summary), or None when the DB has no totals.
+    Rebuilt once per data version, which is re-read at most every DB_CUBE_CHECK_SECONDS;
+    a failed read is re-raised until then, so an outage costs one pool timeout per interval.
+    """
+    if not _db_cube_checked():
+        async with _build_lock:
+            # Requests queued behind a check reuse its outcome
+            if not _db_cube_checked():
+                try:
+                    _cubes["db"] = await _load_db_cube(_cubes["db"])
+                    _cubes["db_error"] = None
+                except Exception as e:
+                    _cubes["db_error"] = e
+                _cubes["db_checked"] = time.time()
+    error = _cubes["db_error"]
+    if error is not None:
+        raise error.with_traceback(None)
+    return _cubes["db"]
@@ -1,11 +1,169 @@
 import os
-import psycopg
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from psycopg import AsyncCursor, sql
+from psycopg.pq import TransactionStatus
+from psycopg_pool import AsyncConnectionPool
 from dotenv import load_dotenv
 
+from api.metrics import add_phase, current_route, observe_query
+
 load_dotenv()
 
-def get_conn():
+# Pool sizing / lifecycle (seconds). Defaults suit a single uvicorn worker on Render.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+
+# Server-side prepared statements for the fixed KPI queries.
+# Disable when running behind a transaction-mode pgbouncer: nothing is prepared then,
+# not even psycopg's automatic preparation of frequently repeated queries.
+PREPARE_STATEMENTS = os.getenv("DB_PREPARE_STATEMENTS", "true").lower() in ("1", "true", "yes")
+
+# Slow-query log (off by default): queries over DB_SLOW_QUERY_MS are logged, with their
+# EXPLAIN (ANALYZE, BUFFERS) plan unless DB_SLOW_QUERY_EXPLAIN is off. ANALYZE runs the
+# query a second time, so keep the threshold high in production.
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "0"))
+DB_SLOW_QUERY_EXPLAIN = os.getenv("DB_SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")
+
+log = logging.getLogger(__name__)
+
+
+class TimedCursor(AsyncCursor):
+    """
+    Cursor for pooled connections: every execute() is timed into api.metrics
+    (per route) and, past DB_SLOW_QUERY_MS, written to the slow-query log.
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        if query == "":
+            # Pool health check on checkout: already part of the db_connect phase
+            return await super().execute(query, params, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - t0
+            slow = DB_SLOW_QUERY_MS > 0 and elapsed * 1000 >= DB_SLOW_QUERY_MS
+            observe_query(elapsed, slow=slow)
+            if slow:
+                await _log_slow_query(self.connection, query, params, elapsed)
+
+
+async def _log_slow_query(conn, query, params, elapsed: float):
+    text = query.as_string(conn) if isinstance(query, sql.Composable) else str(query)
+    plan = None
+    # Only plain reads are re-run under EXPLAIN ANALYZE, and never inside a failed transaction
+    explainable = (
+        text.lstrip().upper().startswith(("SELECT", "WITH"))
+        and conn.info.transaction_status != TransactionStatus.INERROR
+    )
+    if DB_SLOW_QUERY_EXPLAIN and explainable:
+        try:
+            # A plain AsyncCursor: its EXPLAIN must not be timed/logged again
+            async with AsyncCursor(conn) as cur:
+                await cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {text}", params)
+                plan = "\n".join(r[0] for r in await cur.fetchall())
+        except Exception as e:
+            plan = f"(EXPLAIN failed: {type(e).__name__}: {e})"
+    log.warning(
+        "Slow query on %s: %.1f ms\n%s%s",
+        current_route(), elapsed * 1000, text.strip(), f"\n{plan}" if plan else "",
+    )
+
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+def _get_dsn():
     dsn = os.getenv("DATABASE_URL") or os.getenv("PG_DSN")
     if not dsn:
         raise RuntimeError("Set DATABASE_URL (Render) or PG_DSN (local) in environment")
-    return psycopg.connect(dsn)
+    return dsn
+
+
+def _connect_kwargs():
+    kwargs = {"cursor_factory": TimedCursor}
+    if not PREPARE_STATEMENTS:
+        # psycopg otherwise auto-prepares a query after prepare_threshold (5) executions
+        kwargs["prepare_threshold"] = None
+    return kwargs
+
+
+async def get_pool():
+    """
+    Process-wide async connection pool, opened by open_pool() on app startup
+    (or here on first use, if that failed).
+    Connections are health-checked on checkout and recycled after DB_POOL_MAX_LIFETIME.
+    """
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                pool = AsyncConnectionPool(
+                    _get_dsn(),
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    check=AsyncConnectionPool.check_connection,
+                    kwargs=_connect_kwargs(),
+                    name="vaxpulse",
+                    open=False,
+                )
+                await pool.open()
+                _pool = pool
+    return _pool
+
+
+async def open_pool():
+    """
+    Opens the pool at app startup without waiting for connections. A missing DSN is
+    only logged: the API can still serve the OWID fallback, and get_pool() retries.
+    """
+    try:
+        await get_pool()
+    except Exception as e:
+        log.warning("DB pool not opened at startup: %s: %s", type(e).__name__, e)
+
+
+@asynccontextmanager
+async def get_conn():
+    """
+    Borrow a pooled connection. Use as `async with get_conn() as conn:`;
+    the connection is committed/rolled back and returned to the pool on exit.
+    """
+    pool = await get_pool()
+    t0 = time.perf_counter()
+    async with pool.connection() as conn:
+        add_phase("db_connect", time.perf_counter() - t0)
+        yield conn
+
+
+def prepare_flag():
+    """`prepare=` value for cursor.execute on the fixed KPI queries."""
+    # False, not None: None would still let psycopg auto-prepare repeated queries
+    return PREPARE_STATEMENTS
+
+
+async def close_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+
+def pool_stats():
+    """Pool counters from psycopg_pool (pool_size, requests_waiting, connections_errors, ...)."""
+    if _pool is None:
+        return {"open": False}
+    stats = _pool.get_stats()
+    stats.update({"open": True, "prepare_statements": PREPARE_STATEMENTS})
+    return stats
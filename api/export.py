@@ -0,0 +1,122 @@
+import io
+import os
+
+from psycopg import sql
+from psycopg.rows import dict_row
+
+from api.db import get_conn
+from api.formats import ARROW_STREAM, dumps, pa
+
+# Rows fetched per round trip by the NDJSON named cursor (and written per chunk)
+EXPORT_FETCH_ROWS = int(os.getenv("EXPORT_FETCH_ROWS", "5000"))
+
+# Exportable table -> its country column
+EXPORT_TABLES = {
+    "vaccination": "location",
+    "vaccination_by_manu": "country_name",
+    "country_data": "country_name",
+    "vaccination_age_group": "country_name",
+}
+
+FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson", "arrow": ARROW_STREAM}
+
+# Postgres type OID -> Arrow type, for the columns the exportable tables use
+_ARROW_TYPES = {20: "int64", 23: "int32", 701: "float64", 1082: "date32", 25: "string", 1043: "string"}
+
+
+def export_query(table: str, countries, start, end):
+    """
+    SELECT for `table` filtered by countries (None = all) and an inclusive date range,
+    ordered by (country, date). Values are bound client-side so the query can also be
+    wrapped in COPY.
+    """
+    country = sql.Identifier(EXPORT_TABLES[table])
+    filters = [sql.SQL("TRUE")]
+    if countries is not None:
+        filters.append(sql.SQL("{} = ANY({})").format(country, sql.Literal(countries)))
+    if start is not None:
+        filters.append(sql.SQL("date >= {}").format(sql.Literal(start)))
+    if end is not None:
+        filters.append(sql.SQL("date <= {}").format(sql.Literal(end)))
+    return sql.SQL("SELECT * FROM {} WHERE {} ORDER BY {}, date").format(
+        sql.Identifier(table), sql.SQL(" AND ").join(filters), country
+    )
+
+
+async def stream_csv(query):
+    """CSV (with header) straight from COPY ... TO STDOUT, chunk by chunk."""
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            copy_sql = sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER)").format(query)
+            async with cur.copy(copy_sql) as copy:
+                async for chunk in copy:
+                    yield bytes(chunk)
+
+
+async def stream_ndjson(query):
+    """One JSON object per line, read through a server-side (named) cursor."""
+    async with get_conn() as conn:
+        async with conn.transaction():
+            async with conn.cursor(name="export", row_factory=dict_row) as cur:
+                cur.itersize = EXPORT_FETCH_ROWS
+                await cur.execute(query)
+                while True:
+                    rows = await cur.fetchmany(EXPORT_FETCH_ROWS)
+                    if not rows:
+                        break
+                    yield b"".join(dumps(r) + b"\n" for r in rows)
+
+
+async def stream_arrow(query):
+    """
+    Arrow IPC stream, one record batch per EXPORT_FETCH_ROWS rows read through a
+    server-side cursor. The schema comes from the result's column types, so every
+    batch matches it even when a column is all-NULL in that batch.
+    """
+    async with get_conn() as conn:
+        async with conn.transaction():
+            async with conn.cursor(name="export") as cur:
+                await cur.execute(query)
+                rows = await cur.fetchmany(EXPORT_FETCH_ROWS)
+                schema = pa.schema([
+                    (c.name, getattr(pa, _ARROW_TYPES.get(c.type_code, "string"))()) for c in cur.description
+                ])
+                buf = io.BytesIO()
+                with pa.ipc.new_stream(buf, schema) as writer:
+                    while rows:
+                        writer.write_batch(pa.record_batch(
+                            [pa.array(col, type=field.type) for col, field in zip(zip(*rows), schema)],
+                            schema=schema,
+                        ))
+                        yield _drain(buf)
+                        rows = await cur.fetchmany(EXPORT_FETCH_ROWS)
+                yield _drain(buf)  # end-of-stream marker
+
+
+async def primed(stream):
+    """
+    Runs `stream` up to its first chunk, so a pool timeout or a failing query raises
+    here, before any response has started; returns a stream of all of its chunks.
+    """
+    try:
+        head = [await anext(stream)]
+    except StopAsyncIteration:
+        head = []
+
+    async def chunks():
+        try:
+            for chunk in head:
+                yield chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()  # hands the connection back if the client went away
+
+    return chunks()
+
+
+def _drain(buf: io.BytesIO) -> bytes:
+    data = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    return data
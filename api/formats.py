@@ -0,0 +1,168 @@
+import os
+import io
+import json
+import gzip
+from typing import Optional
+
+import numpy as np
+from fastapi import HTTPException, Query, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
+from starlette.datastructures import Headers
+
+from api.metrics import phase
+
+try:
+    import orjson
+except ImportError:  # stdlib json fallback
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output disabled
+    pa = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.vaxpulse.columnar+json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+FORMAT_MEDIA_TYPES = {"json": JSON, "columnar": COLUMNAR_JSON, "arrow": ARROW_STREAM}
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+
+def response_format(
+    request: Request,
+    format: Optional[str] = Query(None, description="json | columnar | arrow (default: from Accept, else json)"),
+):
+    """
+    Dependency: output format from `?format=`, else the Accept header, else json.
+    """
+    if format is None:
+        accept = request.headers.get("accept", "")
+        if ARROW_STREAM in accept:
+            format = "arrow"
+        elif COLUMNAR_JSON in accept:
+            format = "columnar"
+        else:
+            format = "json"
+    if format not in FORMAT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(FORMAT_MEDIA_TYPES)}")
+    if format == "arrow" and pa is None:
+        raise HTTPException(status_code=406, detail="Arrow output requires pyarrow on the server")
+    return format
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_json_default, separators=(",", ":")).encode()
+
+
+def _json_default(o):
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    return str(o)
+
+
+def records_to_columns(records):
+    names = list(records[0]) if records else []
+    return {name: [r.get(name) for r in records] for name in names}
+
+
+def columns_to_records(columns):
+    names = list(columns)
+    values = [c.tolist() if isinstance(c, np.ndarray) else c for c in columns.values()]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def arrow_ipc(columns) -> bytes:
+    table = pa.table({name: (c if isinstance(c, np.ndarray) else pa.array(c)) for name, c in columns.items()})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def respond(fmt: str, data=None, columns=None):
+    """
+    Response in the negotiated format. `data` is the JSON payload and `columns` a
+    {name: sequence} table view of the same rows; either one is derived from the other
+    when omitted, so flat endpoints pass just one of them.
+    """
+    with phase("encode"):
+        if fmt == "json":
+            if data is None:
+                data = columns_to_records(columns)
+            return Response(dumps(data), media_type=JSON)
+
+        if columns is None:
+            columns = records_to_columns(data)
+        if fmt == "columnar":
+            return Response(dumps(columns), media_type=COLUMNAR_JSON)
+        return Response(arrow_ipc(columns), media_type=ARROW_STREAM)
+
+
+def _accept_weights(header: str):
+    """{coding: q} from an Accept-Encoding header; an unparsable q counts as 0."""
+    weights = {}
+    for part in header.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.lower()] = q
+    return weights
+
+
+def choose_encoding(accept_encoding: str):
+    """
+    Best Content-Encoding we can produce for this Accept-Encoding header (or None).
+    Honours q-values: q=0 rules a coding out, `*` covers unlisted ones, ties go to
+    brotli, and an explicitly preferred identity wins.
+    """
+    weights = _accept_weights(accept_encoding)
+    codings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    q = {c: weights.get(c, weights.get("*", 0.0)) for c in codings}
+    best = max(codings, key=q.get)
+    if q[best] <= 0 or q[best] < weights.get("identity", 0.0):
+        return None
+    return best
+
+
+class AcceptGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that honours gzip;q=0 (Starlette only looks for the substring "gzip")."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            weights = _accept_weights(Headers(scope=scope).get("accept-encoding", ""))
+            if weights.get("gzip", weights.get("*", 0.0)) <= 0:
+                await self.app(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
+
+
+def compress(body: bytes, encoding):
+    """(body, applied encoding); small bodies are left as they are."""
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
@@ -1,17 +1,40 @@
 import os
-import csv
-import io
 from datetime import date
 from typing import Optional
-import pandas as pd
-import requests
-from fastapi import FastAPI, HTTPException, Query
+import numpy as np
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 
-from api.db import get_conn
+from api.db import get_conn, open_pool, close_pool, pool_stats, prepare_flag
+from api import metrics
+from api.metrics import MetricsMiddleware, db_failed, served_from
+from api.owid import fetch_owid_store, peek_owid_store, load_current_snapshot, snapshot_info, close_http_client, mom_growth
+from api.cube import METRICS, get_db_cube, get_owid_cube
+from api.cache import cache_responses, data_version, response_cache
+from api.formats import COMPRESS_MIN_BYTES, GZIP_LEVEL, AcceptGZipMiddleware, pa, respond, response_format
+from api.export import EXPORT_TABLES, FORMATS, export_query, primed, stream_arrow, stream_csv, stream_ndjson
 
 app = FastAPI(title="VaxPulse API")
 
+
+@app.on_event("startup")
+async def _startup():
+    await open_pool()
+    # Come up warm from the last published OWID snapshot (disk only, no network)
+    if USE_EXTERNAL_FALLBACK:
+        await run_in_threadpool(load_current_snapshot)
+
+
+@app.on_event("shutdown")
+async def _shutdown():
+    await close_pool()
+    await close_http_client()
+
+# Version-aware response cache + ETag/304 (api/cache.py)
+app.middleware("http")(cache_responses)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -19,265 +42,672 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip for what the response cache doesn't encode itself (streamed exports, live routes)
+app.add_middleware(AcceptGZipMiddleware, minimum_size=COMPRESS_MIN_BYTES, compresslevel=GZIP_LEVEL)
+
+# Outermost: per-route latency and phase breakdown for /metrics (api/metrics.py)
+app.add_middleware(MetricsMiddleware, routes=app.routes)
+
 # -------------------------
 # External data (optional fallback)
 # -------------------------
-OWID_VAX_CSV_URL = os.getenv(
-    "OWID_VAX_CSV_URL",
-    "https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/vaccinations/vaccinations.csv",
-)
 USE_EXTERNAL_FALLBACK = os.getenv("USE_EXTERNAL_FALLBACK", "true").lower() in ("1", "true", "yes")
-HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "25"))
-
-# Cache external CSV in-memory for a short time (simple approach)
-_external_cache = {"ts": None, "rows": None}
-
-def _fetch_owid_csv_rows():
-    """
-    Downloads OWID vaccinations.csv and returns list of dict rows.
-    Lightweight in-memory cache.
-    """
-    import time
-    now = time.time()
-    if _external_cache["rows"] is not None and _external_cache["ts"] is not None:
-        # 10 minutes cache
-        if now - _external_cache["ts"] < 600:
-            return _external_cache["rows"]
 
-    r = requests.get(OWID_VAX_CSV_URL, timeout=HTTP_TIMEOUT)
-    r.raise_for_status()
 
-    f = io.StringIO(r.text)
-    reader = csv.DictReader(f)
-    rows = list(reader)
-
-    _external_cache["ts"] = now
-    _external_cache["rows"] = rows
-    return rows
+async def _fallback_store():
+    """OWID store for a request the DB couldn't answer (counted as an `owid` response)."""
+    served_from("owid")
+    return await fetch_owid_store()
 
 
 # -------------------------
 # Health
 # -------------------------
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus metrics for this worker: request/phase latency, DB query timings,
+    OWID cache and fallback counters, pool/response-cache gauges, ingestion throughput.
+    """
+    for stat, value in pool_stats().items():
+        if isinstance(value, (int, float)):
+            metrics.POOL.set(int(value) if isinstance(value, bool) else value, stat=stat)
+    for stat, value in response_cache.stats().items():
+        metrics.RESPONSE_CACHE.set(value, stat=stat)
+    try:
+        await _collect_ingest_runs()
+    except Exception as e:
+        db_failed(e)
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+async def _collect_ingest_runs():
+    # Ingestion runs out of process; it records its per-table throughput in ingest_run
+    async with get_conn() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                SELECT DISTINCT ON (source, mode, table_name)
+                  source, mode, table_name, rows, seconds, finished_at
+                FROM ingest_run
+                ORDER BY source, mode, table_name, finished_at DESC;
+            """, prepare=prepare_flag())
+            rows = await cur.fetchall()
+    gauges = (metrics.INGEST_ROWS, metrics.INGEST_SECONDS, metrics.INGEST_ROWS_PER_SECOND, metrics.INGEST_FINISHED)
+    for gauge in gauges:
+        gauge.clear()
+    for source, mode, table, n, seconds, finished_at in rows:
+        labels = {"source": source, "mode": mode, "table": table}
+        metrics.INGEST_ROWS.set(n, **labels)
+        metrics.INGEST_SECONDS.set(seconds, **labels)
+        metrics.INGEST_ROWS_PER_SECOND.set(n / max(seconds, 1e-9), **labels)
+        metrics.INGEST_FINISHED.set(finished_at.timestamp(), **labels)
+
+
+@app.get("/meta/pool")
+async def meta_pool():
+    """
+    DB connection pool statistics (size, waiting requests, checkout errors, ...).
+    """
+    return pool_stats()
+
+
+@app.get("/meta/owid-snapshot")
+async def meta_owid_snapshot():
+    """
+    Version and age of the OWID fallback snapshot served by this worker.
+    """
+    return snapshot_info()
+
+
+@app.get("/meta/data-version")
+async def meta_data_version():
+    """
+    Current data-version token (ingestion counter + OWID snapshot) and response-cache counters.
+    """
+    return {"version": await data_version(), "response_cache": response_cache.stats()}
+
+
 # -------------------------
 # Countries
 # -------------------------
 @app.get("/countries")
-def get_countries():
+async def get_countries():
     """
     Prefer DB countries.
     If DB is empty and fallback enabled, return countries from OWID CSV.
     """
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
                     SELECT country_name
                     FROM Location
                     WHERE country_name IS NOT NULL
                     ORDER BY country_name;
                 """)
-                rows = [r[0] for r in cur.fetchall()]
+                rows = [r[0] for r in await cur.fetchall()]
         if rows:
             return rows
     except Exception as e:
+        db_failed(e)
         # DB failed; try external if enabled
         if not USE_EXTERNAL_FALLBACK:
             raise HTTPException(status_code=500, detail=f"Failed to fetch countries: {e}")
 
     if USE_EXTERNAL_FALLBACK:
         try:
-            rows = _fetch_owid_csv_rows()
-            countries = sorted({r["location"] for r in rows if r.get("location")})
-            return countries
+            store = await _fallback_store()
+            return store.countries()
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"DB empty/failed and external fetch failed: {e}")
 
     return []
 
 
+def _owid_monthly_growth(store, country: str):
+    """
+    Month-end totals + MoM growth for one country from the OWID store (slice lookup).
+    """
+    rows = store.country_slice(country)
+    if rows is None:
+        return []
+
+    _, months, totals, growth = store.month_end(rows)
+    return [
+        {"month": str(m.astype("datetime64[D]")), "total": int(t), "growth_rate": (None if np.isnan(g) else float(g))}
+        for m, t, g in zip(months, totals, growth)
+    ]
+
+
+RESOLUTIONS = ("day", "week", "month")
+
+# Upper bound for /kpi/series max_points
+SERIES_MAX_POINTS = int(os.getenv("SERIES_MAX_POINTS", "2000"))
+
+
+def _period_start(dates, resolution: str):
+    # Same buckets as Postgres date_trunc (weeks start on Monday)
+    dates = dates.astype("datetime64[D]")
+    if resolution == "month":
+        return dates.astype("datetime64[M]").astype("datetime64[D]")
+    if resolution == "week":
+        return dates - ((dates.astype(np.int64) + 3) % 7)
+    return dates
+
+
+def _rolling_mean(values, window: int):
+    # Mean over the last `window` periods; NaN unless all of them have a value (pandas rolling().mean())
+    valid = ~np.isnan(values)
+    sums = np.r_[0.0, np.cumsum(np.where(valid, values, 0.0))]
+    counts = np.r_[0, np.cumsum(valid)]
+    out = np.full(len(values), np.nan)
+    if window <= len(values):
+        i = np.arange(window, len(values) + 1)
+        full = (counts[i] - counts[i - window]) == window
+        out[window - 1:] = np.where(full, (sums[i] - sums[i - window]) / window, np.nan)
+    return out
+
+
+def _owid_series(store, country: str, start, end, resolution: str, window: int, max_points: int):
+    """
+    /kpi/series from the OWID store: period-end totals, growth and its rolling mean
+    (doses aren't in the snapshot).
+    """
+    rows = store.country_slice(country)
+    if rows is None:
+        return []
+    totals = store.total_vaccinations[rows]
+    mask = ~np.isnan(totals)
+    periods, totals = _period_start(store.date[rows][mask], resolution), totals[mask]
+    if not len(periods):
+        return []
+
+    starts = np.r_[0, np.flatnonzero(periods[1:] != periods[:-1]) + 1]
+    periods, totals = periods[starts], np.maximum.reduceat(totals, starts)
+    growth = mom_growth(np.zeros(len(totals), dtype=np.int64), totals)
+    rolling = _rolling_mean(growth, window)
+
+    keep = np.ones(len(periods), dtype=bool)
+    if start is not None:
+        keep &= periods >= _period_start(np.array([start], dtype="datetime64[D]"), resolution)[0]
+    if end is not None:
+        keep &= periods <= np.datetime64(end, "D")
+    idx = np.flatnonzero(keep)
+    idx = idx[_downsample(len(idx), max_points)]
+
+    def num(v):
+        return None if np.isnan(v) else float(v)
+
+    return [
+        {"period": str(periods[i]), "total": int(totals[i]), "doses": None,
+         "growth_rate": num(growth[i]), "rolling_growth_rate": num(rolling[i]), "rolling_doses": None}
+        for i in idx
+    ]
+
+
+def _downsample(n: int, max_points: int):
+    # Every k-th point counted back from the latest, so the newest point is always kept
+    stride = max(-(-n // max_points), 1)
+    return np.arange(n - 1, -1, -stride)[::-1]
+
+
+# -------------------------
+# DB queries (shared by the per-KPI endpoints and the country bundle)
+# -------------------------
+async def _db_monthly_growth(cur, country: str):
+    # Materialized by ingestion (country_monthly_summary), one row per month
+    await cur.execute("""
+        SELECT month, month_end_total_vaccinations, growth_rate
+        FROM country_monthly_summary
+        WHERE country_name = %s
+          AND month_end_total_vaccinations IS NOT NULL
+        ORDER BY month;
+    """, (country,), prepare=prepare_flag())
+    return [
+        {"month": r[0].isoformat(), "total": int(r[1]), "growth_rate": (float(r[2]) if r[2] is not None else None)}
+        for r in await cur.fetchall()
+    ]
+
+
+async def _db_manufacturer_share(cur, country: str):
+    # Latest-date snapshot maintained by ingestion (manufacturer_latest)
+    await cur.execute("""
+        SELECT vaccine, total_vaccinations
+        FROM manufacturer_latest
+        WHERE country_name = %s
+        ORDER BY total_vaccinations DESC
+        LIMIT 15;
+    """, (country,), prepare=prepare_flag())
+    return [{"vaccine": r[0], "total": int(r[1])} for r in await cur.fetchall()]
+
+
+async def _db_last_updated(cur, country: str):
+    # MAX(date) of the country's vaccination rows, maintained by ingestion (country_quality)
+    await cur.execute("""
+        SELECT last_date
+        FROM country_quality
+        WHERE country_name = %s;
+    """, (country,), prepare=prepare_flag())
+    row = await cur.fetchone()
+    return row[0] if row else None
+
+
+_QUALITY_COLUMNS = """
+    country_name, row_count, first_date, last_date, CURRENT_DATE - last_date,
+    observed_months, expected_months, missing_months, max_gap_days, null_rates, computed_at
+"""
+
+
+def _quality_row(r):
+    null_rates = r[9] or {}
+    return {
+        "country": r[0],
+        "rows": int(r[1]),
+        "first_date": r[2].isoformat() if r[2] else None,
+        "last_date": r[3].isoformat() if r[3] else None,
+        "days_since_last": r[4],
+        "months": int(r[5]),
+        "expected_months": int(r[6]),
+        "missing_months": int(r[7]),
+        "max_gap_days": r[8],
+        "null_rate_total": float(null_rates.get("total_vaccination") or 0.0),
+        "null_rates": null_rates,
+        "computed_at": r[10].isoformat(),
+    }
+
+
+async def _db_quality(cur, country: str):
+    # Precomputed by ingestion (country_quality)
+    await cur.execute(f"""
+        SELECT {_QUALITY_COLUMNS}
+        FROM country_quality
+        WHERE country_name = %s;
+    """, (country,), prepare=prepare_flag())
+    r = await cur.fetchone()
+    if r is None:
+        return {"country": country, "months": 0, "missing_months": 0, "null_rate_total": 0.0}
+    return _quality_row(r)
+
+
+def _summarize(country: str, series):
+    """KPI tiles from a monthly growth series (as returned by /kpi/monthly-growth)."""
+    if not series:
+        return {"country": country, "latest_total": None, "latest_growth_rate": None, "peak_growth_rate": None, "as_of": None}
+
+    latest = series[-1]
+    growth_rates = [r["growth_rate"] for r in series if r.get("growth_rate") is not None]
+    peak = max(growth_rates) if growth_rates else None
+
+    return {
+        "country": country,
+        "latest_total": latest.get("total"),
+        "latest_growth_rate": latest.get("growth_rate"),
+        "peak_growth_rate": peak,
+        "as_of": latest.get("month"),
+    }
+
+
 # -------------------------
 # KPI: Monthly Growth (DB)
 # -------------------------
+async def _monthly_growth_series(country: str):
+    """
+    Month-end total vaccinations + MoM growth rate (DB-backed, OWID fallback).
+    """
+    try:
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                rows = await _db_monthly_growth(cur, country)
+        if rows:
+            return rows
+
+    except Exception as e:
+        db_failed(e)
+        if not USE_EXTERNAL_FALLBACK:
+            raise HTTPException(status_code=500, detail=f"monthly_growth failed: {e}")
+
+    # Optional external fallback for monthly growth
+    if USE_EXTERNAL_FALLBACK:
+        try:
+            store = await _fallback_store()
+            return _owid_monthly_growth(store, country)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"External monthly growth failed: {e}")
+
+    return []
+
+
 @app.get("/kpi/monthly-growth/{country}")
-def monthly_growth(country: str):
+async def monthly_growth(country: str, fmt: str = Depends(response_format)):
     """
     Month-end total vaccinations + MoM growth rate (DB-backed).
     """
+    return respond(fmt, await _monthly_growth_series(country))
+
+
+# -------------------------
+# KPI: time series at day/week/month resolution
+# -------------------------
+@app.get("/kpi/series/{country}")
+async def kpi_series(
+    country: str,
+    start: Optional[date] = Query(None, description="First date (inclusive)"),
+    end: Optional[date] = Query(None, description="Last date (inclusive)"),
+    resolution: str = Query("month", description="day | week | month"),
+    window: int = Query(3, ge=1, le=365, description="Rolling window, in periods"),
+    max_points: int = Query(500, ge=2, description="Downsample to at most this many points"),
+    fmt: str = Depends(response_format),
+):
+    """
+    Period-end totals, doses, period-over-period growth and rolling means, computed in SQL.
+    Growth and rolling values see the full history, so they are correct at `start`;
+    long ranges are thinned to `max_points` (latest point always kept).
+    """
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {list(RESOLUTIONS)}")
+    max_points = min(max_points, SERIES_MAX_POINTS)
+
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    WITH daily AS (
-                      SELECT
-                        date::date AS d,
-                        total_vaccination::bigint AS total
-                      FROM Vaccination
-                      WHERE location = %s
-                        AND total_vaccination IS NOT NULL
-                    ),
-                    month_end AS (
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    WITH buckets AS (
                       SELECT
-                        date_trunc('month', d)::date AS month,
-                        MAX(total) AS total
-                      FROM daily
+                        date_trunc(%(res)s, date)::date AS period,
+                        MAX(total_vaccination) AS total,
+                        SUM(daily_vaccination) AS doses
+                      FROM vaccination
+                      WHERE location = %(country)s
+                        AND (%(end)s::date IS NULL OR date <= %(end)s::date)
                       GROUP BY 1
+                      HAVING MAX(total_vaccination) IS NOT NULL
                     ),
                     growth AS (
                       SELECT
-                        month,
-                        total,
-                        CASE
-                          WHEN LAG(total) OVER (ORDER BY month) IS NULL THEN NULL
-                          WHEN LAG(total) OVER (ORDER BY month) = 0 THEN NULL
-                          ELSE (total - LAG(total) OVER (ORDER BY month))::float
-                               / LAG(total) OVER (ORDER BY month)
-                        END AS growth_rate
-                      FROM month_end
+                        period, total, doses,
+                        (total - LAG(total) OVER (ORDER BY period))::double precision
+                          / NULLIF(LAG(total) OVER (ORDER BY period), 0) AS growth_rate
+                      FROM buckets
+                    ),
+                    rolling AS (
+                      SELECT
+                        period, total, doses, growth_rate,
+                        CASE WHEN COUNT(growth_rate) OVER w = %(window)s THEN AVG(growth_rate) OVER w END AS rolling_growth_rate,
+                        CASE WHEN COUNT(doses) OVER w = %(window)s THEN AVG(doses) OVER w END AS rolling_doses
+                      FROM growth
+                      WINDOW w AS (ORDER BY period ROWS BETWEEN %(window)s - 1 PRECEDING AND CURRENT ROW)
+                    ),
+                    ranged AS (
+                      SELECT
+                        r.*,
+                        ROW_NUMBER() OVER (ORDER BY period DESC) - 1 AS from_latest,
+                        COUNT(*) OVER () AS n
+                      FROM rolling r
+                      WHERE %(start)s::date IS NULL OR period >= date_trunc(%(res)s, %(start)s::date)::date
                     )
-                    SELECT month, total, growth_rate
-                    FROM growth
-                    ORDER BY month;
-                """, (country,))
-                rows = cur.fetchall()
+                    SELECT period, total, doses, growth_rate, rolling_growth_rate, rolling_doses
+                    FROM ranged
+                    WHERE from_latest %% GREATEST(CEIL(n::double precision / %(max_points)s)::int, 1) = 0
+                    ORDER BY period;
+                """, {"res": resolution, "country": country, "start": start, "end": end,
+                      "window": window, "max_points": max_points}, prepare=prepare_flag())
+                rows = await cur.fetchall()
 
         if rows:
-            return [
-                {"month": r[0].isoformat(), "total": int(r[1]), "growth_rate": (float(r[2]) if r[2] is not None else None)}
+            return respond(fmt, [
+                {
+                    "period": r[0].isoformat(),
+                    "total": int(r[1]),
+                    "doses": (int(r[2]) if r[2] is not None else None),
+                    "growth_rate": (float(r[3]) if r[3] is not None else None),
+                    "rolling_growth_rate": (float(r[4]) if r[4] is not None else None),
+                    "rolling_doses": (float(r[5]) if r[5] is not None else None),
+                }
                 for r in rows
-            ]
-
+            ])
     except Exception as e:
+        db_failed(e)
         if not USE_EXTERNAL_FALLBACK:
-            raise HTTPException(status_code=500, detail=f"monthly_growth failed: {e}")
+            raise HTTPException(status_code=500, detail=f"kpi_series failed: {e}")
 
-    # Optional external fallback for monthly growth
     if USE_EXTERNAL_FALLBACK:
         try:
-            rows = _fetch_owid_csv_rows()
-            # Filter rows for country; use date + total_vaccinations field (OWID)
-            crows = [r for r in rows if r.get("location") == country and r.get("date") and r.get("total_vaccinations")]
-            if not crows:
-                return []
-
-            df = pd.DataFrame(crows)
-            df["date"] = pd.to_datetime(df["date"])
-            df["total"] = pd.to_numeric(df["total_vaccinations"], errors="coerce")
-            df = df.dropna(subset=["date", "total"]).sort_values("date")
-            df["month"] = df["date"].dt.to_period("M").dt.to_timestamp()
-
-            month_end = df.groupby("month")["total"].max().reset_index()
-            month_end["growth_rate"] = month_end["total"].pct_change()
-
-            return [
-                {"month": d["month"].date().isoformat(), "total": int(d["total"]), "growth_rate": (None if pd.isna(d["growth_rate"]) else float(d["growth_rate"]))}
-                for _, d in month_end.iterrows()
-            ]
+            store = await _fallback_store()
+            return respond(fmt, _owid_series(store, country, start, end, resolution, window, max_points))
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"External monthly growth failed: {e}")
+            raise HTTPException(status_code=500, detail=f"External series failed: {e}")
 
-    return []
+    return respond(fmt, [])
 
 
 # -------------------------
 # KPI: Manufacturer share (DB only; OWID has separate CSV for manufacturers)
 # -------------------------
 @app.get("/kpi/manufacturer-share/{country}")
-def manufacturer_share(country: str):
+async def manufacturer_share(country: str):
     """
     Returns top manufacturers for the LATEST date available for the country (DB-backed).
     """
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT MAX(date::date)
-                    FROM Vaccination_by_manu
-                    WHERE country_name = %s;
-                """, (country,))
-                latest = cur.fetchone()[0]
-
-                if latest is None:
-                    return []
-
-                cur.execute("""
-                    SELECT vaccine, total_vaccinations::bigint AS total
-                    FROM Vaccination_by_manu
-                    WHERE country_name = %s
-                      AND date::date = %s
-                      AND total_vaccinations IS NOT NULL
-                    ORDER BY total DESC
-                    LIMIT 15;
-                """, (country, latest))
-                rows = cur.fetchall()
-
-        return [{"vaccine": r[0], "total": int(r[1])} for r in rows]
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                return await _db_manufacturer_share(cur, country)
     except Exception as e:
+        db_failed(e)
         raise HTTPException(status_code=500, detail=f"manufacturer_share failed: {e}")
 
 
+@app.get("/kpi/manufacturer-share/{country}/history")
+async def manufacturer_share_history(
+    country: str,
+    start: Optional[date] = Query(None, description="First date (inclusive)"),
+    end: Optional[date] = Query(None, description="Last date (inclusive)"),
+    max_points: int = Query(500, ge=2, description="Downsample to at most this many dates"),
+):
+    """
+    Per-date manufacturer totals and their share of that date's total (DB-backed).
+    Long ranges are thinned to `max_points` dates, like /kpi/series (latest date always kept).
+    """
+    max_points = min(max_points, SERIES_MAX_POINTS)
+    try:
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    WITH dated AS (
+                      SELECT
+                        date,
+                        vaccine,
+                        total_vaccinations,
+                        total_vaccinations::double precision
+                          / NULLIF(SUM(total_vaccinations) OVER (PARTITION BY date), 0) AS share,
+                        DENSE_RANK() OVER (ORDER BY date DESC) - 1 AS from_latest
+                      FROM vaccination_by_manu
+                      WHERE country_name = %(country)s
+                        AND total_vaccinations IS NOT NULL
+                        AND (%(start)s::date IS NULL OR date >= %(start)s::date)
+                        AND (%(end)s::date IS NULL OR date <= %(end)s::date)
+                    ),
+                    ranged AS (
+                      SELECT d.*, MAX(from_latest) OVER () + 1 AS n
+                      FROM dated d
+                    )
+                    SELECT date, vaccine, total_vaccinations, share
+                    FROM ranged
+                    WHERE from_latest %% GREATEST(CEIL(n::double precision / %(max_points)s)::int, 1) = 0
+                    ORDER BY date, total_vaccinations DESC;
+                """, {"country": country, "start": start, "end": end, "max_points": max_points}, prepare=prepare_flag())
+                rows = await cur.fetchall()
+
+        return [
+            {"date": r[0].isoformat(), "vaccine": r[1], "total": int(r[2]), "share": (float(r[3]) if r[3] is not None else None)}
+            for r in rows
+        ]
+    except Exception as e:
+        db_failed(e)
+        raise HTTPException(status_code=500, detail=f"manufacturer_share_history failed: {e}")
+
+
 # -------------------------
 # KPI tiles summary for Superset-style top cards
 # -------------------------
 @app.get("/kpi/summary/{country}")
-def kpi_summary(country: str):
+async def kpi_summary(country: str):
     """
     Summary KPIs to populate top cards.
     Uses DB monthly growth; falls back to external if enabled.
     """
-    series = monthly_growth(country)
-    if not series:
-        return {"country": country, "latest_total": None, "latest_growth_rate": None, "peak_growth_rate": None, "as_of": None}
+    return _summarize(country, await _monthly_growth_series(country))
 
-    latest = series[-1]
-    growth_rates = [r["growth_rate"] for r in series if r.get("growth_rate") is not None]
-    peak = max(growth_rates) if growth_rates else None
 
-    return {
-        "country": country,
-        "latest_total": latest.get("total"),
-        "latest_growth_rate": latest.get("growth_rate"),
-        "peak_growth_rate": peak,
-        "as_of": latest.get("month"),
-    }
+# -------------------------
+# Batch KPIs (many countries, one set-based query)
+# -------------------------
+def _parse_countries(countries: str):
+    """`A,B,...` -> de-duplicated list; `all` -> None (every country)."""
+    if countries.strip().lower() == "all":
+        return None
+    names = list(dict.fromkeys(c.strip() for c in countries.split(",") if c.strip()))
+    if not names:
+        raise HTTPException(status_code=400, detail="countries must be a comma-separated list or 'all'")
+    return names
+
+
+async def _batch_monthly_growth(names):
+    """{country: series} for `names` (None = all) from the DB, OWID-filled when enabled."""
+    grouped = {}
+    try:
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    SELECT country_name, month, month_end_total_vaccinations, growth_rate
+                    FROM country_monthly_summary
+                    WHERE (%s::text[] IS NULL OR country_name = ANY(%s::text[]))
+                      AND month_end_total_vaccinations IS NOT NULL
+                    ORDER BY country_name, month;
+                """, (names, names), prepare=prepare_flag())
+                for r in await cur.fetchall():
+                    grouped.setdefault(r[0], []).append(
+                        {"month": r[1].isoformat(), "total": int(r[2]), "growth_rate": (float(r[3]) if r[3] is not None else None)}
+                    )
+    except Exception as e:
+        db_failed(e)
+        if not USE_EXTERNAL_FALLBACK:
+            raise HTTPException(status_code=500, detail=f"batch monthly_growth failed: {e}")
+
+    # Like the per-country endpoint: OWID fills countries the DB has no series for
+    # (for `all`, only when the DB has none at all)
+    missing = [c for c in names if c not in grouped] if names is not None else None
+    if USE_EXTERNAL_FALLBACK and (missing or (names is None and not grouped)):
+        try:
+            store = await _fallback_store()
+            for c in (missing if names is not None else store.countries()):
+                series = _owid_monthly_growth(store, c)
+                if series:
+                    grouped[c] = series
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"External monthly growth failed: {e}")
+
+    if names is None:
+        return grouped
+    return {c: grouped.get(c, []) for c in names}
+
+
+@app.get("/kpi/monthly-growth")
+async def monthly_growth_batch(
+    countries: str = Query(..., description="Comma-separated country names, or 'all'"),
+    fmt: str = Depends(response_format),
+):
+    """
+    {country: monthly growth series} for many countries in one query
+    (columnar/arrow: one flat table with a `country` column).
+    """
+    grouped = await _batch_monthly_growth(_parse_countries(countries))
+    if fmt == "json":
+        return respond(fmt, grouped)
+    return respond(fmt, [{"country": c, **r} for c, series in grouped.items() for r in series])
+
+
+@app.get("/kpi/summary")
+async def kpi_summary_batch(
+    countries: str = Query(..., description="Comma-separated country names, or 'all'"),
+    fmt: str = Depends(response_format),
+):
+    """
+    {country: KPI tiles} for many countries; latest and peak come from one windowed query.
+    """
+    names = _parse_countries(countries)
+    grouped = {}
+    try:
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    SELECT DISTINCT ON (country_name)
+                      country_name,
+                      month,
+                      month_end_total_vaccinations,
+                      growth_rate,
+                      MAX(growth_rate) OVER (PARTITION BY country_name) AS peak_growth_rate
+                    FROM country_monthly_summary
+                    WHERE (%s::text[] IS NULL OR country_name = ANY(%s::text[]))
+                      AND month_end_total_vaccinations IS NOT NULL
+                    ORDER BY country_name, month DESC;
+                """, (names, names), prepare=prepare_flag())
+                for r in await cur.fetchall():
+                    grouped[r[0]] = {
+                        "country": r[0],
+                        "latest_total": int(r[2]),
+                        "latest_growth_rate": (float(r[3]) if r[3] is not None else None),
+                        "peak_growth_rate": (float(r[4]) if r[4] is not None else None),
+                        "as_of": r[1].isoformat(),
+                    }
+    except Exception as e:
+        db_failed(e)
+        if not USE_EXTERNAL_FALLBACK:
+            raise HTTPException(status_code=500, detail=f"batch kpi_summary failed: {e}")
+
+    missing = [c for c in names if c not in grouped] if names is not None else None
+    if USE_EXTERNAL_FALLBACK and (missing or (names is None and not grouped)):
+        fallback = await _batch_monthly_growth(missing)
+        grouped.update({c: _summarize(c, series) for c, series in fallback.items()})
+
+    if names is not None:
+        grouped = {c: grouped.get(c) or _summarize(c, []) for c in names}
+    if fmt == "json":
+        return respond(fmt, grouped)
+    return respond(fmt, list(grouped.values()))
 
 
 # -------------------------
 # Meta: last updated
 # -------------------------
 @app.get("/meta/last-updated/{country}")
-def meta_last_updated_country(country: str):
+async def meta_last_updated_country(country: str):
     """
     DB last-updated for this country. If DB empty and fallback enabled, infer from OWID.
     """
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT MAX(date::date)
-                    FROM Vaccination
-                    WHERE location = %s;
-                """, (country,))
-                d = cur.fetchone()[0]
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                d = await _db_last_updated(cur, country)
         if d:
             return {"country": country, "last_updated": d.isoformat()}
     except Exception as e:
+        db_failed(e)
         if not USE_EXTERNAL_FALLBACK:
             raise HTTPException(status_code=500, detail=f"meta_last_updated_country failed: {e}")
 
     if USE_EXTERNAL_FALLBACK:
         try:
-            rows = _fetch_owid_csv_rows()
-            crows = [r for r in rows if r.get("location") == country and r.get("date")]
-            if not crows:
+            store = await _fallback_store()
+            last = store.last_date(country)
+            if last is None:
                 return {"country": country, "last_updated": None}
-            last = max(r["date"] for r in crows)
-            return {"country": country, "last_updated": last}
+            return {"country": country, "last_updated": str(last)}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"External last-updated failed: {e}")
 
@@ -288,124 +718,159 @@ def meta_last_updated_country(country: str):
 # Quality: summary
 # -------------------------
 @app.get("/quality/summary/{country}")
-def quality_summary(country: str):
+async def quality_summary(country: str):
     """
     DB quality summary. (External quality can be added later if needed.)
     """
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT COUNT(DISTINCT date_trunc('month', date::date))
-                    FROM Vaccination
-                    WHERE location = %s;
-                """, (country,))
-                observed_months = cur.fetchone()[0] or 0
-
-                cur.execute("""
-                    WITH bounds AS (
-                      SELECT
-                        date_trunc('month', MIN(date::date)) AS min_m,
-                        date_trunc('month', MAX(date::date)) AS max_m
-                      FROM Vaccination
-                      WHERE location = %s
-                    ),
-                    all_months AS (
-                      SELECT generate_series(min_m, max_m, interval '1 month') AS m
-                      FROM bounds
-                      WHERE min_m IS NOT NULL AND max_m IS NOT NULL
-                    )
-                    SELECT COUNT(*) FROM all_months;
-                """, (country,))
-                expected_months = cur.fetchone()[0] or 0
-
-                missing_months = max(expected_months - observed_months, 0)
-
-                cur.execute("""
-                    SELECT
-                      CASE WHEN COUNT(*) = 0 THEN 0
-                           ELSE SUM(CASE WHEN total_vaccination IS NULL THEN 1 ELSE 0 END)::float / COUNT(*)
-                      END AS null_rate_total
-                    FROM Vaccination
-                    WHERE location = %s;
-                """, (country,))
-                null_rate_total = cur.fetchone()[0] or 0.0
-
-        return {
-            "country": country,
-            "months": int(observed_months),
-            "missing_months": int(missing_months),
-            "null_rate_total": float(null_rate_total),
-        }
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                return await _db_quality(cur, country)
     except Exception as e:
+        db_failed(e)
         raise HTTPException(status_code=500, detail=f"quality_summary failed: {e}")
 
 
-# -------------------------
-# World map data (country comparison)
-# -------------------------
-@app.get("/map/world")
-def map_world(metric: str = Query(..., description="latest_total_vaccinations | latest_mom_growth_rate")):
-    if not USE_EXTERNAL_FALLBACK:
-        raise HTTPException(status_code=400, detail="Enable USE_EXTERNAL_FALLBACK=true for world map.")
-
+@app.get("/quality/all")
+async def quality_all():
+    """
+    Quality profile of every country in one query (precomputed at ingestion time).
+    """
     try:
-        rows = _fetch_owid_csv_rows()
-        if not rows:
-            raise HTTPException(status_code=500, detail="OWID CSV returned 0 rows")
-
-        df = pd.DataFrame(rows)
-
-        required_base = {"iso_code", "location", "date"}
-        missing = required_base - set(df.columns)
-        if missing:
-            raise HTTPException(status_code=500, detail=f"OWID CSV missing columns: {sorted(missing)}")
-
-        # Filter to countries only
-        df = df[df["iso_code"].notna() & df["location"].notna() & df["date"].notna()]
-        df = df[~df["iso_code"].str.startswith("OWID", na=False)]
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"""
+                    SELECT {_QUALITY_COLUMNS}
+                    FROM country_quality
+                    ORDER BY country_name;
+                """, prepare=prepare_flag())
+                return [_quality_row(r) for r in await cur.fetchall()]
+    except Exception as e:
+        db_failed(e)
+        raise HTTPException(status_code=500, detail=f"quality_all failed: {e}")
 
-        df["date"] = pd.to_datetime(df["date"], errors="coerce")
-        df = df.dropna(subset=["date"])
 
-        if metric == "latest_total_vaccinations":
-            if "total_vaccinations" not in df.columns:
-                raise HTTPException(status_code=500, detail="OWID CSV missing total_vaccinations column")
+# -------------------------
+# Country bundle (everything the dashboard shows for one country)
+# -------------------------
+@app.get("/country/{country}/bundle")
+async def country_bundle(country: str):
+    """
+    Summary, monthly series, manufacturer share, quality and last-updated in one response.
+    All DB reads share one pooled connection and the series is computed once;
+    series and last-updated fall back to the OWID snapshot like their own endpoints.
+    """
+    series, last_updated = [], None
+    manufacturer, quality = [], None
+    try:
+        async with get_conn() as conn:
+            async with conn.cursor() as cur:
+                series = await _db_monthly_growth(cur, country)
+                manufacturer = await _db_manufacturer_share(cur, country)
+                quality = await _db_quality(cur, country)
+                d = await _db_last_updated(cur, country)
+                last_updated = d.isoformat() if d else None
+    except Exception as e:
+        db_failed(e)
+        if not USE_EXTERNAL_FALLBACK:
+            raise HTTPException(status_code=500, detail=f"country_bundle failed: {e}")
 
-            df["total_vaccinations"] = pd.to_numeric(df["total_vaccinations"], errors="coerce")
-            df = df.dropna(subset=["total_vaccinations"])
+    if USE_EXTERNAL_FALLBACK and (not series or last_updated is None):
+        try:
+            store = await _fallback_store()
+            if not series:
+                series = _owid_monthly_growth(store, country)
+            if last_updated is None:
+                last = store.last_date(country)
+                last_updated = str(last) if last is not None else None
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"External country bundle failed: {e}")
 
-            idx = df.groupby("location")["date"].idxmax()
-            latest = df.loc[idx, ["location", "iso_code", "total_vaccinations"]].copy()
-            latest = latest.rename(columns={"location": "country", "total_vaccinations": "value"})
-            return latest.to_dict(orient="records")
+    return {
+        "country": country,
+        "summary": _summarize(country, series),
+        "monthly_growth": series,
+        "manufacturer_share": manufacturer,
+        "quality": quality,
+        "last_updated": last_updated,
+    }
 
-        elif metric == "latest_mom_growth_rate":
-            if "total_vaccinations" not in df.columns:
-                raise HTTPException(status_code=500, detail="OWID CSV missing total_vaccinations column")
 
-            df["total_vaccinations"] = pd.to_numeric(df["total_vaccinations"], errors="coerce")
-            df = df.dropna(subset=["total_vaccinations"])
+# -------------------------
+# World map data (country comparison)
+# -------------------------
+@app.get("/map/world")
+async def map_world(
+    metric: str = Query(..., description="latest_total_vaccinations | latest_mom_growth_rate"),
+    as_of: Optional[date] = Query(None, description="Values as of the month containing this date (default: latest)"),
+    fmt: str = Depends(response_format),
+):
+    """
+    Served from a precomputed country x month cube (DB-backed; OWID snapshot as fallback).
+    """
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail="Unknown metric")
 
-            df["month"] = df["date"].dt.to_period("M").dt.to_timestamp()
-            month_end = df.groupby(["location", "iso_code", "month"])["total_vaccinations"].max().reset_index()
-            month_end = month_end.sort_values(["location", "month"])
-            month_end["growth_rate"] = month_end.groupby("location")["total_vaccinations"].pct_change()
-            month_end = month_end.dropna(subset=["growth_rate"])
+    cube = None
+    try:
+        if USE_EXTERNAL_FALLBACK:
+            # iso codes for DB countries come from the OWID snapshot, but the DB-backed map
+            # never waits for it: until one is mapped the cube is built without iso codes
+            peek_owid_store()
+        cube = await get_db_cube()
+        if cube is not None:
+            served_from("db")
+    except Exception as e:
+        db_failed(e)
+        if not USE_EXTERNAL_FALLBACK:
+            raise HTTPException(status_code=500, detail=f"map_world failed: {e}")
 
-            if month_end.empty:
-                return []
+    if cube is None and USE_EXTERNAL_FALLBACK:
+        try:
+            served_from("owid")
+            cube = await get_owid_cube()
+        except Exception as e:
+            # This makes the Render logs + client error clearer
+            raise HTTPException(status_code=500, detail=f"map_world crashed: {type(e).__name__}: {e}")
 
-            idx = month_end.groupby("location")["month"].idxmax()
-            latest = month_end.loc[idx, ["location", "iso_code", "growth_rate"]].copy()
-            latest = latest.rename(columns={"location": "country", "growth_rate": "value"})
-            return latest.to_dict(orient="records")
+    if cube is None:
+        return respond(fmt, [])
+    return respond(fmt, columns=cube.lookup_columns(metric, as_of))
 
-        else:
-            raise HTTPException(status_code=400, detail="Unknown metric")
 
-    except HTTPException:
-        raise
+# -------------------------
+# Bulk export (streamed straight from Postgres)
+# -------------------------
+@app.get("/export/{table}")
+async def export_table(
+    table: str,
+    countries: str = Query("all", description="Comma-separated country names, or 'all'"),
+    start: Optional[date] = Query(None, description="First date (inclusive)"),
+    end: Optional[date] = Query(None, description="Last date (inclusive)"),
+    format: str = Query("csv", description="csv | ndjson | arrow"),
+):
+    """
+    Streams a whole table (optionally filtered) as CSV via COPY TO STDOUT, or as NDJSON /
+    Arrow IPC batches via a server-side cursor. Rows are never materialized in the API process.
+    The query runs before the response starts, so a DB failure is a 503 rather than a
+    truncated 200.
+    """
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table; exportable: {sorted(EXPORT_TABLES)}")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(FORMATS)}")
+    if format == "arrow" and pa is None:
+        raise HTTPException(status_code=406, detail="Arrow output requires pyarrow on the server")
+
+    query = export_query(table, _parse_countries(countries), start, end)
+    stream = {"csv": stream_csv, "ndjson": stream_ndjson, "arrow": stream_arrow}[format](query)
+    try:
+        stream = await primed(stream)
     except Exception as e:
-        # This makes the Render logs + client error clearer
-        raise HTTPException(status_code=500, detail=f"map_world crashed: {type(e).__name__}: {e}")
+        db_failed(e)
+        raise HTTPException(status_code=503, detail=f"export failed: {type(e).__name__}: {e}")
+    return StreamingResponse(
+        stream,
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'},
+    )
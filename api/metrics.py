@@ -0,0 +1,265 @@
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from starlette.routing import Match
+
+log = logging.getLogger(__name__)
+
+# Prometheus text exposition format (served by GET /metrics), without a client library.
+# Values are per worker process: with several uvicorn workers each scrape sees one of them.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(v) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    """Cumulative buckets + _sum/_count per label set."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, seconds: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, upper in enumerate(self.buckets):
+                if seconds <= upper:
+                    counts[i] += 1
+            self._values[key] = (counts, total + seconds)
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = [
+            f"{self.name}_bucket{_labels(self.label_names, key, [('le', _number(upper))])} {n}"
+            for upper, n in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {counts[-1]}")
+        return lines
+
+
+def render() -> bytes:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return ("\n".join(lines) + "\n").encode()
+
+
+# -------------------------
+# Metrics
+# -------------------------
+HTTP_REQUEST_SECONDS = Histogram(
+    "vaxpulse_http_request_duration_seconds", "Request latency until the response is fully sent.",
+    ("route", "method", "status"),
+)
+HTTP_PHASE_SECONDS = Histogram(
+    "vaxpulse_http_phase_duration_seconds",
+    "Time per request spent in each phase (db_connect, db_query, owid, encode, compress; app = the rest).",
+    ("route", "phase"),
+)
+DB_QUERY_SECONDS = Histogram("vaxpulse_db_query_duration_seconds", "Execution time of API queries.", ("route",))
+DB_SLOW_QUERIES = Counter("vaxpulse_db_slow_queries_total", "Queries slower than DB_SLOW_QUERY_MS.", ("route",))
+DB_ERRORS = Counter("vaxpulse_db_errors_total", "DB reads that failed (and fell back, where enabled).", ("route", "error"))
+RESPONSES_BY_SOURCE = Counter(
+    "vaxpulse_responses_by_source_total", "Responses by where their data came from (db | owid).", ("route", "source"),
+)
+OWID_CACHE = Counter(
+    "vaxpulse_owid_cache_total",
+    "OWID snapshot lookups: hit (fresh), stale (served, refresh scheduled), miss (waited for a download).",
+    ("result",),
+)
+OWID_REFRESHES = Counter(
+    "vaxpulse_owid_refresh_total", "OWID revalidations: downloaded, not_modified, reused (another worker), error.",
+    ("result",),
+)
+OWID_DOWNLOAD_SECONDS = Histogram("vaxpulse_owid_download_seconds", "Conditional GET of the OWID CSV.")
+OWID_PARSE_SECONDS = Histogram("vaxpulse_owid_parse_seconds", "Parsing + publishing a new OWID snapshot.")
+POOL = Gauge("vaxpulse_db_pool", "psycopg_pool statistics.", ("stat",))
+RESPONSE_CACHE = Gauge("vaxpulse_response_cache", "Response cache entries, bytes, hits and misses.", ("stat",))
+INGEST_ROWS = Gauge("vaxpulse_ingest_rows", "Rows loaded per table by the latest ingestion run.", ("source", "mode", "table"))
+INGEST_SECONDS = Gauge("vaxpulse_ingest_seconds", "Load time per table in the latest ingestion run.", ("source", "mode", "table"))
+INGEST_ROWS_PER_SECOND = Gauge(
+    "vaxpulse_ingest_rows_per_second", "Throughput per table in the latest ingestion run.", ("source", "mode", "table"),
+)
+INGEST_FINISHED = Gauge(
+    "vaxpulse_ingest_finished_timestamp_seconds", "When the latest ingestion run finished.", ("source", "mode", "table"),
+)
+
+
+# -------------------------
+# Per-request state
+# -------------------------
+# {"scope", "routes", "phases": {name: seconds}, "source", "db_failed"} for the request being served.
+# Endpoints, DB cursors and the OWID cache only ever mutate it, so updates made in
+# threadpool workers or call_next tasks (copied contexts) are seen by the middleware.
+_request = contextvars.ContextVar("vaxpulse_request", default=None)
+
+
+def add_phase(name: str, seconds: float):
+    state = _request.get()
+    if state is not None:
+        state["phases"][name] = state["phases"].get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - t0)
+
+
+def served_from(source: str):
+    """Records where the current response's data came from; `owid` wins over `db`."""
+    state = _request.get()
+    if state is not None and state["source"] != "owid":
+        state["source"] = source
+
+
+def degraded() -> bool:
+    """True when the current response fell back to OWID because a DB read failed."""
+    state = _request.get()
+    return state is not None and state["db_failed"] and state["source"] == "owid"
+
+
+def current_route() -> str:
+    state = _request.get()
+    if state is None:
+        return "-"
+    scope = state["scope"]
+    route = scope.get("route")
+    if route is None:
+        # Not routed (yet): e.g. answered by the response cache before the router ran
+        route = next((r for r in state["routes"] if r.matches(scope)[0] == Match.FULL), None)
+    return route.path if route is not None else "unmatched"
+
+
+def observe_query(seconds: float, slow: bool = False):
+    route = current_route()
+    DB_QUERY_SECONDS.observe(seconds, route=route)
+    if slow:
+        DB_SLOW_QUERIES.inc(route=route)
+    add_phase("db_query", seconds)
+    served_from("db")
+
+
+def db_failed(exc: Exception):
+    """Counts (and logs) a failed DB read; callers decide whether to fall back."""
+    state = _request.get()
+    if state is not None:
+        state["db_failed"] = True
+    route = current_route()
+    DB_ERRORS.inc(route=route, error=type(exc).__name__)
+    log.warning("DB read failed on %s: %s: %s", route, type(exc).__name__, exc)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request end to end (including streamed bodies)
+    and reporting the per-phase breakdown collected while it ran.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = {"scope": scope, "routes": self.routes, "phases": {}, "source": None, "db_failed": False}
+        token = _request.set(state)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - t0
+            route = current_route()
+            _request.reset(token)
+            HTTP_REQUEST_SECONDS.observe(elapsed, route=route, method=scope["method"], status=status[0])
+            accounted = 0.0
+            for name, seconds in state["phases"].items():
+                HTTP_PHASE_SECONDS.observe(seconds, route=route, phase=name)
+                accounted += seconds
+            HTTP_PHASE_SECONDS.observe(max(elapsed - accounted, 0.0), route=route, phase="app")
+            if state["source"] is not None:
+                RESPONSES_BY_SOURCE.inc(route=route, source=state["source"])
@@ -0,0 +1,468 @@
+import io
+import os
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from api.metrics import OWID_CACHE, OWID_DOWNLOAD_SECONDS, OWID_PARSE_SECONDS, OWID_REFRESHES, phase
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX dev machines: no cross-worker lock
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# -------------------------
+# OWID vaccinations.csv (external fallback source)
+# -------------------------
+OWID_VAX_CSV_URL = os.getenv(
+    "OWID_VAX_CSV_URL",
+    "https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/vaccinations/vaccinations.csv",
+)
+HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "25"))
+OWID_CACHE_TTL = int(os.getenv("OWID_CACHE_TTL", "600"))
+# After a failed refresh, non-waiting readers (peek_owid_store) retry no sooner than this
+OWID_RETRY_SECONDS = int(os.getenv("OWID_RETRY_SECONDS", "30"))
+
+# Parsed snapshots are persisted here and memory-mapped read-only by every worker
+OWID_SNAPSHOT_DIR = Path(os.getenv("OWID_SNAPSHOT_DIR", ".cache/owid"))
+OWID_SNAPSHOT_KEEP = int(os.getenv("OWID_SNAPSHOT_KEEP", "2"))
+
+# Only the columns the API actually serves are kept
+REQUIRED_COLUMNS = ("location", "iso_code", "date")
+NUMERIC_COLUMNS = ("total_vaccinations",)
+
+
+class OwidStore:
+    """
+    Columnar, per-country indexed view of the OWID vaccinations CSV.
+
+    Rows are sorted by (location, date); `location_code` indexes `locations`
+    (categorical) and `offsets[i]:offsets[i + 1]` is the row range of location i,
+    so a per-country lookup is a slice rather than a scan.
+    """
+
+    def __init__(self, locations, iso_codes, offsets, location_code, date, total_vaccinations):
+        self.locations = locations
+        self.iso_codes = iso_codes
+        self.offsets = offsets
+        self.location_code = location_code
+        self.date = date
+        self.total_vaccinations = total_vaccinations
+        self._index = {name: i for i, name in enumerate(locations)}
+
+    def __len__(self):
+        return len(self.date)
+
+    @classmethod
+    def from_csv(cls, content: bytes):
+        head = pd.read_csv(io.BytesIO(content), nrows=0)
+        missing = set(REQUIRED_COLUMNS) - set(head.columns)
+        if missing:
+            raise ValueError(f"OWID CSV missing columns: {sorted(missing)}")
+        numeric = [c for c in NUMERIC_COLUMNS if c in head.columns]
+
+        df = pd.read_csv(
+            io.BytesIO(content),
+            usecols=list(REQUIRED_COLUMNS) + numeric,
+            dtype={"location": "category", "iso_code": "category", **{c: "float64" for c in numeric}},
+        )
+        df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
+        df = df.dropna(subset=["location", "date"])
+        for c in NUMERIC_COLUMNS:
+            if c not in df.columns:
+                df[c] = np.nan
+
+        codes = df["location"].cat.codes.to_numpy()
+        dates = df["date"].to_numpy().astype("datetime64[D]")
+        order = np.lexsort((dates, codes))
+        codes, dates = codes[order], dates[order]
+
+        # Re-number locations densely (unused categories dropped) and build row ranges
+        categories = np.asarray(df["location"].cat.categories, dtype=object)
+        used, location_code = np.unique(codes, return_inverse=True)
+        offsets = np.searchsorted(location_code, np.arange(len(used) + 1)).astype(np.int64)
+
+        iso = df["iso_code"].to_numpy(dtype=object)[order]
+        iso_codes = np.array(
+            [None if pd.isna(iso[s]) else str(iso[s]) for s in offsets[:-1]], dtype=object
+        )
+
+        return cls(
+            locations=categories[used],
+            iso_codes=iso_codes,
+            offsets=offsets,
+            location_code=location_code.astype(np.int32),
+            date=dates,
+            total_vaccinations=df["total_vaccinations"].to_numpy(dtype=np.float64)[order],
+        )
+
+    # Array columns persisted as .npy files (memory-mappable); the rest goes in meta.json
+    ARRAYS = ("offsets", "location_code", "date", "total_vaccinations")
+
+    def save(self, path: Path, meta: dict):
+        path.mkdir(parents=True)
+        for name in self.ARRAYS:
+            np.save(path / f"{name}.npy", getattr(self, name), allow_pickle=False)
+        meta = dict(meta, locations=self.countries(), iso_codes=list(self.iso_codes))
+        (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path):
+        """
+        Maps a saved snapshot read-only; pages are shared through the OS page cache,
+        so adding workers does not add a copy of the data per process.
+        """
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r", allow_pickle=False) for name in cls.ARRAYS}
+        store = cls(
+            locations=np.array(meta.pop("locations"), dtype=object),
+            iso_codes=np.array(meta.pop("iso_codes"), dtype=object),
+            **arrays,
+        )
+        return store, meta
+
+    def countries(self):
+        return [str(name) for name in self.locations]
+
+    def country_slice(self, country: str):
+        i = self._index.get(country)
+        if i is None:
+            return None
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def last_date(self, country: str):
+        s = self.country_slice(country)
+        if s is None or s.stop == s.start:
+            return None
+        return self.date[s.stop - 1]
+
+    def month_end(self, rows=slice(None)):
+        """
+        Month-end (max) total_vaccinations per (location, month) over `rows`,
+        ignoring missing totals. Returns (location_code, month, total, growth_rate) arrays;
+        growth_rate is MoM within each location (NaN for the first month or a 0 base).
+        """
+        codes = self.location_code[rows]
+        months = self.date[rows].astype("datetime64[M]")
+        totals = self.total_vaccinations[rows]
+
+        mask = ~np.isnan(totals)
+        codes, months, totals = codes[mask], months[mask], totals[mask]
+        if len(codes) == 0:
+            empty = np.array([], dtype=np.float64)
+            return codes, months, empty, empty
+
+        # Rows are sorted by (location, date), so (location, month) groups are contiguous
+        starts = np.r_[0, np.flatnonzero((codes[1:] != codes[:-1]) | (months[1:] != months[:-1])) + 1]
+        codes, months = codes[starts], months[starts]
+        totals = np.maximum.reduceat(totals, starts)
+        return codes, months, totals, mom_growth(codes, totals)
+
+
+def mom_growth(codes, totals):
+    """
+    Period-over-period growth of `totals` within each run of equal `codes`
+    (NaN for the first period of a location or a 0 base).
+    """
+    prev = np.r_[np.nan, totals[:-1]]
+    same_location = np.r_[False, codes[1:] == codes[:-1]]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = (totals - prev) / prev
+    growth[~same_location | (prev == 0)] = np.nan
+    return growth
+
+
+# -------------------------
+# On-disk snapshots
+# -------------------------
+# Layout: OWID_SNAPSHOT_DIR/<version>/{*.npy, meta.json}, where version is a content hash,
+# plus a CURRENT json file ({"version", "fetched_at", ...}) naming the live snapshot.
+# CURRENT is swapped atomically with os.replace, so readers never see a partial snapshot.
+
+def _read_current():
+    try:
+        return json.loads((OWID_SNAPSHOT_DIR / "CURRENT").read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_current(state: dict):
+    pointer = OWID_SNAPSHOT_DIR / f".CURRENT-{os.getpid()}"
+    pointer.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(pointer, OWID_SNAPSHOT_DIR / "CURRENT")
+
+
+def publish_snapshot(store: OwidStore, state: dict):
+    """
+    Persists `store` under state["version"] and points CURRENT at it. Safe to call
+    from several workers at once: the first writer of a version wins, later ones reuse it.
+    """
+    version = state["version"]
+    target = OWID_SNAPSHOT_DIR / version
+    if not target.exists():
+        tmp = OWID_SNAPSHOT_DIR / f".tmp-{os.getpid()}-{version}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        store.save(tmp, {"version": version, "rows": len(store)})
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            # Another worker published the same version first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    _write_current(state)
+    _prune_snapshots(keep=version)
+
+
+def _prune_snapshots(keep: str):
+    # Mapped files stay valid after unlink, so older versions can go once CURRENT moved on
+    versions = sorted(
+        (p for p in OWID_SNAPSHOT_DIR.iterdir() if p.is_dir() and not p.name.startswith(".")),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for p in [v for v in versions if v.name != keep][max(OWID_SNAPSHOT_KEEP - 1, 0):]:
+        shutil.rmtree(p, ignore_errors=True)
+
+
+def load_current_snapshot():
+    """
+    Maps the CURRENT on-disk snapshot into this worker (no network); only re-maps
+    when the version changed. Returns the store, or None if nothing was published yet.
+    """
+    state = _read_current()
+    if state is None:
+        return _external_cache["store"]
+
+    loaded = _external_cache["state"]
+    if loaded is None or loaded["version"] != state.get("version"):
+        try:
+            store, _ = OwidStore.load(OWID_SNAPSHOT_DIR / state["version"])
+        except Exception as e:
+            # CURRENT names a pruned or partially written snapshot: keep what this worker
+            # has (nothing, on a cold start) and drop the pointer so the next refresh downloads
+            log.warning("OWID snapshot %s is unreadable, ignoring it: %s: %s", state.get("version"), type(e).__name__, e)
+            _discard_current(state)
+            return _external_cache["store"]
+        _external_cache["store"] = store
+    _external_cache["state"] = state
+    return _external_cache["store"]
+
+
+def _discard_current(state: dict):
+    # Only if no other worker has published a newer snapshot in the meantime
+    if _read_current() == state:
+        try:
+            (OWID_SNAPSHOT_DIR / "CURRENT").unlink()
+        except FileNotFoundError:
+            pass
+
+
+# -------------------------
+# Download + cache (stale-while-revalidate)
+# -------------------------
+# Live store for this worker (memory-mapped from the snapshot directory)
+_external_cache = {"store": None, "state": None}
+
+# Single in-flight refresh per worker; the snapshot-dir lock extends that across workers
+_refresh = {"task": None, "last_error": None, "last_checked": None}
+
+# Shared non-blocking HTTP client (connection reuse across OWID fetches)
+_http_client = None
+
+
+def _get_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, follow_redirects=True)
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _snapshot_age():
+    state = _external_cache["state"]
+    return None if state is None else time.time() - state["fetched_at"]
+
+
+def _build_snapshot(content: bytes, etag=None, last_modified=None):
+    store = OwidStore.from_csv(content)
+    if not len(store):
+        raise ValueError("OWID CSV returned 0 rows")
+
+    publish_snapshot(store, {
+        "version": hashlib.sha256(content).hexdigest()[:16],
+        "fetched_at": time.time(),
+        "source_url": OWID_VAX_CSV_URL,
+        "etag": etag,
+        "last_modified": last_modified,
+    })
+    return load_current_snapshot()
+
+
+def _touch_snapshot():
+    # Upstream answered 304: same version, fresh again
+    _write_current(dict(_external_cache["state"], fetched_at=time.time()))
+    return load_current_snapshot()
+
+
+@asynccontextmanager
+async def _snapshot_lock():
+    """Exclusive lock on the snapshot dir so only one worker downloads at a time."""
+    OWID_SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(OWID_SNAPSHOT_DIR / ".lock", "w") as fh:
+        await run_in_threadpool(fcntl.flock, fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+async def _revalidate():
+    """
+    Brings the snapshot up to date: reuse one another worker just published,
+    otherwise send a conditional GET (ETag / Last-Modified) and rebuild only on 200.
+    """
+    try:
+        async with _snapshot_lock():
+            await run_in_threadpool(load_current_snapshot)
+            age = _snapshot_age()
+            if age is not None and age < OWID_CACHE_TTL:
+                OWID_REFRESHES.inc(result="reused")
+                return
+
+            headers = {}
+            state = _external_cache["state"]
+            if _external_cache["store"] is not None and state.get("source_url") == OWID_VAX_CSV_URL:
+                if state.get("etag"):
+                    headers["If-None-Match"] = state["etag"]
+                if state.get("last_modified"):
+                    headers["If-Modified-Since"] = state["last_modified"]
+
+            t0 = time.perf_counter()
+            r = await _get_http_client().get(OWID_VAX_CSV_URL, headers=headers)
+            OWID_DOWNLOAD_SECONDS.observe(time.perf_counter() - t0)
+            if r.status_code == 304:
+                await run_in_threadpool(_touch_snapshot)
+                OWID_REFRESHES.inc(result="not_modified")
+            else:
+                r.raise_for_status()
+                # Parsing + writing a multi-MB snapshot is CPU/disk-bound; keep it off the event loop
+                t0 = time.perf_counter()
+                await run_in_threadpool(
+                    _build_snapshot, r.content, r.headers.get("etag"), r.headers.get("last-modified")
+                )
+                OWID_PARSE_SECONDS.observe(time.perf_counter() - t0)
+                OWID_REFRESHES.inc(result="downloaded")
+        _refresh["last_error"] = None
+    except Exception as e:
+        OWID_REFRESHES.inc(result="error")
+        _refresh["last_error"] = f"{type(e).__name__}: {e}"
+        log.warning("OWID snapshot refresh failed: %s", _refresh["last_error"])
+        raise
+    finally:
+        _refresh["last_checked"] = time.time()
+
+
+def _schedule_refresh():
+    task = _refresh["task"]
+    if task is None or task.done():
+        task = asyncio.create_task(_revalidate())
+        # Failures are recorded in _refresh["last_error"]; don't warn about unretrieved exceptions
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        _refresh["task"] = task
+    return task
+
+
+async def fetch_owid_store():
+    """
+    Returns the OWID vaccinations data as an OwidStore.
+    A stale snapshot is served immediately while one background task revalidates it;
+    callers only wait when this worker has no snapshot at all.
+    """
+    with phase("owid"):
+        store = _external_cache["store"]
+        if store is None:
+            store = await run_in_threadpool(load_current_snapshot)
+
+        if store is None:
+            # Nothing to serve yet: every caller waits on the same download
+            OWID_CACHE.inc(result="miss")
+            await asyncio.shield(_schedule_refresh())
+            return _external_cache["store"]
+
+        age = _snapshot_age()
+        if age is None or age >= OWID_CACHE_TTL:
+            OWID_CACHE.inc(result="stale")
+            _schedule_refresh()
+        else:
+            OWID_CACHE.inc(result="hit")
+        return store
+
+
+def peek_owid_store():
+    """
+    Store already mapped in this worker, without ever waiting on the network: a missing
+    or stale snapshot is fetched by the background refresher. None until one has landed.
+    """
+    store = _external_cache["store"]
+    age = _snapshot_age()
+    if store is None or age is None or age >= OWID_CACHE_TTL:
+        last_checked = _refresh["last_checked"]
+        backing_off = (
+            _refresh["last_error"] is not None
+            and last_checked is not None
+            and time.time() - last_checked < OWID_RETRY_SECONDS
+        )
+        if not backing_off:
+            _schedule_refresh()
+    return store
+
+
+def current_store():
+    """Store already mapped in this worker (no refresh; None before the first snapshot)."""
+    return _external_cache["store"]
+
+
+def snapshot_version():
+    state = _external_cache["state"]
+    return None if state is None else state["version"]
+
+
+def snapshot_info():
+    """Version / age of the snapshot this worker serves, plus refresher status."""
+    state = _external_cache["state"] or {}
+    age = _snapshot_age()
+    task = _refresh["task"]
+    return {
+        "version": state.get("version"),
+        "fetched_at": state.get("fetched_at"),
+        "age_seconds": (round(age, 1) if age is not None else None),
+        "ttl_seconds": OWID_CACHE_TTL,
+        "stale": (age is None or age >= OWID_CACHE_TTL),
+        "etag": state.get("etag"),
+        "last_modified": state.get("last_modified"),
+        "source_url": state.get("source_url"),
+        "rows": (len(_external_cache["store"]) if _external_cache["store"] is not None else None),
+        "refreshing": (task is not None and not task.done()),
+        "last_checked": _refresh["last_checked"],
+        "last_error": _refresh["last_error"],
+    }
@@ -0,0 +1,61 @@
+"""
+Side-by-side diff of two benchmarks.run result files.
+
+    python -m benchmarks.compare benchmarks/results/<before>.json benchmarks/results/<after>.json
+
+Latency deltas above --threshold percent are flagged as regressions (slower) or
+improvements (faster); ingestion compares rows/s.
+"""
+import sys
+import json
+import argparse
+from pathlib import Path
+
+
+def pct(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def flag(change, threshold, higher_is_better=False):
+    if change is None:
+        return ""
+    worse = change < -threshold if higher_is_better else change > threshold
+    better = change > threshold if higher_is_better else change < -threshold
+    return "REGRESSION" if worse else ("improved" if better else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change worth flagging")
+    args = parser.parse_args()
+
+    a, b = json.loads(args.before.read_text()), json.loads(args.after.read_text())
+    print(f"{a['meta'].get('commit')} -> {b['meta'].get('commit')}  ({args.metric}, ±{args.threshold:g}%)")
+    regressions = 0
+
+    for run in sorted(set(a.get("ingestion", {})) & set(b.get("ingestion", {}))):
+        x, y = a["ingestion"][run]["rows_per_s"], b["ingestion"][run]["rows_per_s"]
+        change = pct(x, y)
+        mark = flag(change, args.threshold, higher_is_better=True)
+        regressions += mark == "REGRESSION"
+        print(f"  ingestion/{run:28s} {x:>12,.0f} -> {y:>12,.0f} rows/s  {change:+7.1f}%  {mark}")
+
+    for section in ("endpoints_db", "endpoints_owid"):
+        for name in sorted(set(a.get(section, {})) & set(b.get(section, {}))):
+            x, y = a[section][name].get(args.metric), b[section][name].get(args.metric)
+            change = pct(x, y)
+            mark = flag(change, args.threshold)
+            regressions += mark == "REGRESSION"
+            shown = f"{change:+7.1f}%" if change is not None else "      —"
+            print(f"  {section[10:]}/{name:31s} {x or 0:>10.2f} -> {y or 0:>10.2f} ms  {shown}  {mark}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
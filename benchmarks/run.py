@@ -0,0 +1,313 @@
+"""
+End-to-end performance benchmark: synthetic data -> ingestion -> API under load.
+
+    BENCH_PG_DSN=postgresql://localhost/vaxpulse_bench python -m benchmarks.run --countries 235 --days 730
+
+1. Generates a synthetic dataset (benchmarks.synthetic) and applies sql/migrations.
+2. Ingestion: full SQLite load, an incremental pass over appended days and the
+   OWID CSV loader (rows/s per table).
+3. Starts the API (uvicorn) against the loaded DB and drives every endpoint with
+   --concurrency clients for --requests requests (p50/p95/p99 latency, req/s).
+4. Repeats the read-only endpoints on the OWID fallback path: the API gets an empty
+   schema and downloads the synthetic CSV from a local HTTP stand-in.
+
+Results go to one JSON file (see benchmarks.compare). BENCH_PG_DSN must point at a
+disposable database: the public schema is truncated and reloaded.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import platform
+import argparse
+import datetime as dt
+import subprocess
+from pathlib import Path
+import numpy as np
+import httpx
+import psycopg
+from psycopg.conninfo import make_conninfo
+
+from benchmarks.synthetic import OWID_COUNTRIES, country_name, write_dataset
+from ingestion import ingest_sqlite_to_postgres as sqlite_ingest
+from ingestion.ingest_owid_csv_to_postgres import load_owid_csv
+from scripts.migrate import migrate as apply_migrations
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# (name, path template); {country} is drawn per request from the synthetic countries
+DB_ENDPOINTS = [
+    ("countries", "/countries"),
+    ("monthly_growth", "/kpi/monthly-growth/{country}"),
+    ("summary", "/kpi/summary/{country}"),
+    ("series_week", "/kpi/series/{country}?resolution=week"),
+    ("series_day", "/kpi/series/{country}?resolution=day&max_points=500"),
+    ("manufacturer_share", "/kpi/manufacturer-share/{country}"),
+    ("manufacturer_history", "/kpi/manufacturer-share/{country}/history"),
+    ("quality_summary", "/quality/summary/{country}"),
+    ("quality_all", "/quality/all"),
+    ("bundle", "/country/{country}/bundle"),
+    ("last_updated", "/meta/last-updated/{country}"),
+    ("map_world", "/map/world?metric=latest_total_vaccinations"),
+    ("map_world_arrow", "/map/world?metric=latest_mom_growth_rate&format=arrow"),
+    ("summary_batch_all", "/kpi/summary?countries=all"),
+    ("export_country_csv", "/export/vaccination?countries={country}"),
+]
+OWID_ENDPOINTS = [
+    ("countries", "/countries"),
+    ("monthly_growth", "/kpi/monthly-growth/{country}"),
+    ("summary", "/kpi/summary/{country}"),
+    ("series_week", "/kpi/series/{country}?resolution=week"),
+    ("last_updated", "/meta/last-updated/{country}"),
+    ("map_world", "/map/world?metric=latest_total_vaccinations"),
+    ("summary_batch_all", "/kpi/summary?countries=all"),
+]
+
+
+# -------------------------
+# Setup
+# -------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def with_schema(dsn: str, schema: str):
+    """`dsn` with search_path pinned to `schema` (fresh, empty tables for the fallback run)."""
+    return make_conninfo(dsn, options=f"-c search_path={schema}")
+
+
+def migrate(dsn: str, schema: str = None):
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        if schema:
+            conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+            conn.execute(f"CREATE SCHEMA {schema};")
+    target = with_schema(dsn, schema) if schema else dsn
+    with psycopg.connect(target, autocommit=True) as conn:
+        apply_migrations(conn, log=lambda msg: None)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+# -------------------------
+# Ingestion
+# -------------------------
+def table_stats(results):
+    return {
+        table: {"rows": n, "seconds": round(elapsed, 4), "rows_per_s": round(n / max(elapsed, 1e-9), 1)}
+        for table, n, elapsed in results
+    }
+
+
+def bench_ingestion(dsn: str, data_dir: Path, args):
+    out = {}
+    source = str(data_dir / "source.db")
+
+    t0 = time.perf_counter()
+    results = sqlite_ingest.run_full(source, dsn)
+    elapsed = time.perf_counter() - t0
+    rows = sum(n for _, n, _ in results)
+    out["sqlite_full"] = {"rows": rows, "seconds": round(elapsed, 3), "rows_per_s": round(rows / elapsed, 1),
+                          "tables": table_stats(results)}
+
+    # Append --incremental-days to the source and upsert only those
+    write_dataset(data_dir, args.countries, args.days + args.incremental_days, args.vaccines, args.seed, day_from=args.days)
+    t0 = time.perf_counter()
+    results = sqlite_ingest.run_incremental(source, dsn)
+    elapsed = time.perf_counter() - t0
+    rows = sum(n for _, n, _ in results)
+    out["sqlite_incremental"] = {"rows": rows, "seconds": round(elapsed, 3), "rows_per_s": round(rows / elapsed, 1),
+                                 "tables": table_stats(results)}
+
+    # CSV loader into its own schema so it starts from empty tables
+    migrate(dsn, "bench_owid_csv")
+    t0 = time.perf_counter()
+    with psycopg.connect(with_schema(dsn, "bench_owid_csv")) as pg:
+        results = load_owid_csv(pg, str(data_dir / "vaccinations.csv"), incremental=False)
+    elapsed = time.perf_counter() - t0
+    rows = sum(n for _, n, _ in results)
+    out["owid_csv"] = {"rows": rows, "seconds": round(elapsed, 3), "rows_per_s": round(rows / elapsed, 1),
+                       "tables": table_stats(results)}
+    return out
+
+
+# -------------------------
+# API load
+# -------------------------
+class Server:
+    """uvicorn (api.main:app) in a subprocess, torn down on exit."""
+
+    def __init__(self, env: dict, workers: int):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        cmd = [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(self.port),
+               "--workers", str(workers), "--log-level", "warning"]
+        self.proc = subprocess.Popen(cmd, cwd=ROOT, env={**os.environ, **env})
+
+    def __enter__(self):
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if httpx.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        self.proc.kill()
+        raise RuntimeError("API did not start")
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        self.proc.wait(timeout=15)
+
+
+def latency_stats(latencies, errors, wall):
+    ms = np.array(latencies) * 1000
+    n = len(latencies)
+    stats = {"requests": n + errors, "errors": errors, "rps": round(n / wall, 1) if wall else None}
+    if n:
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        stats.update({"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2),
+                      "mean_ms": round(ms.mean(), 2), "max_ms": round(ms.max(), 2)})
+    return stats
+
+
+async def drive(url: str, template: str, countries, requests: int, concurrency: int, seed: int):
+    """`requests` GETs of `template` from `concurrency` concurrent clients; per-request latency."""
+    rng = np.random.default_rng(seed)
+    paths = [template.format(country=c) for c in rng.choice(countries, size=requests)]
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for p in paths:
+        queue.put_nowait(p)
+
+    async def worker(client):
+        nonlocal errors
+        while not queue.empty():
+            path = queue.get_nowait()
+            t0 = time.perf_counter()
+            try:
+                r = await client.get(path)
+                await r.aread()
+                if r.status_code == 200:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        # Warm-up (pool, prepared statements, snapshot/cube builds) is not measured
+        await client.get(paths[0])
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    return latency_stats(latencies, errors, wall)
+
+
+def bench_endpoints(url: str, endpoints, countries, args):
+    out = {}
+    for name, template in endpoints:
+        stats = asyncio.run(drive(url, template, countries, args.requests, args.concurrency, args.seed))
+        print(f"  {name:24s} p50 {stats.get('p50_ms', '—'):>8} ms  p95 {stats.get('p95_ms', '—'):>8} ms  "
+              f"p99 {stats.get('p99_ms', '—'):>8} ms  {stats['rps']:>8} req/s  errors {stats['errors']}")
+        out[name] = {"path": template, **stats}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--countries", type=int, default=OWID_COUNTRIES)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies --countries")
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--incremental-days", type=int, default=7)
+    parser.add_argument("--vaccines", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--response-cache", action="store_true", help="keep the API response cache on")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["ingestion", "db", "owid"])
+    parser.add_argument("--data-dir", type=Path, default=Path(os.getenv("BENCH_DIR", ".cache/bench")))
+    parser.add_argument("--out", type=Path, default=None, help="results JSON (default: benchmarks/results/<commit>-<time>.json)")
+    args = parser.parse_args()
+    args.countries = round(args.countries * args.scale)
+
+    dsn = os.environ.get("BENCH_PG_DSN")
+    if not dsn:
+        raise RuntimeError("Set BENCH_PG_DSN to a disposable local database (it is truncated and reloaded)")
+
+    commit = git_commit()
+    results = {
+        "meta": {
+            "commit": commit,
+            "started_at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        },
+    }
+    countries = [country_name(i) for i in range(args.countries)]
+
+    print(f"Generating {args.countries:,} countries x {args.days:,} days x {args.vaccines} vaccines ...")
+    t0 = time.perf_counter()
+    results["dataset"] = write_dataset(args.data_dir, args.countries, args.days, args.vaccines, args.seed)
+    results["dataset"]["seconds"] = round(time.perf_counter() - t0, 2)
+    migrate(dsn)
+
+    if "ingestion" not in args.skip:
+        print("Ingestion ...")
+        results["ingestion"] = bench_ingestion(dsn, args.data_dir, args)
+    else:
+        sqlite_ingest.run_full(str(args.data_dir / "source.db"), dsn)
+
+    api_env = {
+        "DATABASE_URL": dsn,
+        "OWID_SNAPSHOT_DIR": str(args.data_dir / "owid-snapshots"),
+        "DB_POOL_MAX_SIZE": str(max(args.concurrency, 10)),
+    }
+    if not args.response_cache:
+        api_env["RESPONSE_CACHE_MAX_MB"] = "0"
+
+    if "db" not in args.skip:
+        print(f"API, DB path ({args.concurrency} concurrent clients, {args.requests} requests per endpoint) ...")
+        with Server({**api_env, "USE_EXTERNAL_FALLBACK": "false"}, args.workers) as api:
+            results["endpoints_db"] = bench_endpoints(api.url, DB_ENDPOINTS, countries, args)
+
+    if "owid" not in args.skip:
+        print("API, OWID fallback path (empty schema + local CSV stand-in) ...")
+        migrate(dsn, "bench_empty")
+        csv_port = free_port()
+        stand_in = subprocess.Popen(
+            [sys.executable, "-m", "http.server", str(csv_port), "--bind", "127.0.0.1"],
+            cwd=args.data_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            env = {
+                **api_env,
+                "DATABASE_URL": with_schema(dsn, "bench_empty"),
+                "USE_EXTERNAL_FALLBACK": "true",
+                "OWID_VAX_CSV_URL": f"http://127.0.0.1:{csv_port}/vaccinations.csv",
+            }
+            with Server(env, args.workers) as api:
+                results["endpoints_owid"] = bench_endpoints(api.url, OWID_ENDPOINTS, countries, args)
+        finally:
+            stand_in.terminate()
+
+    out = args.out or ROOT / "benchmarks/results" / f"{commit or 'nocommit'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2))
+    print(f"✅ Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
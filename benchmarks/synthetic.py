@@ -0,0 +1,188 @@
+"""
+Synthetic VaxPulse datasets at configurable scale.
+
+Writes the ingestion source (a SQLite file shaped like assets/Vaccinations.db, with the
+column set and primary keys of sql/migrations/001_init.sql) and the equivalent OWID
+vaccinations.csv used by the API fallback:
+
+    python -m benchmarks.synthetic --countries 235 --days 730 --vaccines 8 --out .cache/bench
+
+Defaults are roughly OWID-sized; --scale multiplies the country count (e.g. --scale 100).
+Generation is seeded, so the same arguments always produce the same data.
+"""
+import os
+import argparse
+import sqlite3
+import datetime as dt
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from ingestion.ingest_sqlite_to_postgres import KEYS, TABLES
+
+OWID_COUNTRIES = 235
+START_DATE = dt.date(2021, 1, 1)
+AGE_GROUPS = ("12-17", "18-24", "25-49", "50-59", "60+")
+SQLITE_TYPES = {"date": "TEXT", "text": "TEXT", "int8": "INTEGER", "float8": "REAL"}
+
+OWID_CSV_COLUMNS = [
+    "location", "iso_code", "date", "total_vaccinations", "people_vaccinated", "people_fully_vaccinated",
+    "total_boosters", "daily_vaccinations_raw", "daily_vaccinations", "total_vaccinations_per_hundred",
+    "people_vaccinated_per_hundred", "people_fully_vaccinated_per_hundred", "daily_vaccinations_per_million",
+    "daily_people_vaccinated", "daily_people_vaccinated_per_hundred",
+]
+
+
+def country_name(i: int) -> str:
+    return f"Country {i:05d}"
+
+
+def create_sqlite_schema(sq):
+    for table, source, columns in TABLES:
+        cols = ", ".join(f"{name} {SQLITE_TYPES[pg_type]}" for name, pg_type in columns)
+        sq.execute(f"CREATE TABLE IF NOT EXISTS {source} ({cols}, PRIMARY KEY ({', '.join(KEYS[table])}));")
+
+
+def country_days(seed: int, i: int, days: int, day_from: int = 0):
+    """
+    One country's daily series for days [day_from, days): cumulative totals from a
+    per-country rollout curve, with ~10% of totals missing like OWID's reporting gaps.
+    Days before `day_from` are generated too (and dropped) so totals stay cumulative.
+    """
+    crng = np.random.default_rng([seed, i])
+    population = int(crng.integers(100_000, 300_000_000))
+    peak = crng.uniform(0.002, 0.01) * population
+    t = np.arange(days)
+    rate = peak * np.exp(-((t - crng.uniform(60, 300)) / crng.uniform(80, 240)) ** 2)
+    daily = crng.poisson(rate).astype(np.int64)
+    total = np.cumsum(daily)
+    missing = crng.random(days) < 0.1
+    keep = slice(day_from, days)
+    return {
+        "population": population,
+        "daily": daily[keep],
+        "total": total[keep],
+        "missing": missing[keep],
+        "day": t[keep],
+    }
+
+
+def write_dataset(out: Path, countries: int, days: int, vaccines: int, seed: int = 42, day_from: int = 0):
+    """
+    Writes (or, with day_from > 0, appends days [day_from, days) to) out/source.db and
+    out/vaccinations.csv. Returns {table: rows written}.
+    """
+    out.mkdir(parents=True, exist_ok=True)
+    db_path, csv_path = out / "source.db", out / "vaccinations.csv"
+    if day_from == 0:
+        for p in (db_path, csv_path):
+            if p.exists():
+                p.unlink()
+
+    all_dates = [START_DATE + dt.timedelta(days=d) for d in range(days)]
+    sqlite_dates = np.array([d.strftime("%d/%m/%Y") for d in all_dates], dtype=object)
+    iso_dates = np.array([d.isoformat() for d in all_dates], dtype=object)
+    vaccine_names = [f"Vaccine {v:02d}" for v in range(vaccines)]
+    last_date = sqlite_dates[-1]
+
+    sq = sqlite3.connect(db_path)
+    sq.execute("PRAGMA journal_mode = OFF;")
+    sq.execute("PRAGMA synchronous = OFF;")
+    create_sqlite_schema(sq)
+    counts = {source: 0 for _, source, _ in TABLES}
+
+    for i in range(countries):
+        name = country_name(i)
+        s = country_days(seed, i, days, day_from)
+        daily, total, day = s["daily"], s["total"], s["day"]
+        total_or_none = np.where(s["missing"], None, total).astype(object)
+        per_hundred = total / s["population"] * 100
+        d_sql = sqlite_dates[day]
+
+        sq.execute(
+            "INSERT OR REPLACE INTO Location VALUES (?, ?, ?, ?);",
+            (name, last_date, "Synthetic", "https://example.invalid/vaccinations"),
+        )
+        vax = pd.DataFrame({
+            "date": d_sql,
+            "location": name,
+            "total_vaccination": total_or_none,
+            "people_vaccinated": total // 2,
+            "people_fully_vaccinated": total // 3,
+            "total_boosters": total // 10,
+            "daily_vaccinations_raw": daily,
+            "daily_vaccination": daily,
+            "total_vaccination_per_hundred": per_hundred,
+            "people_vaccinated_per_hundred": per_hundred / 2,
+            "people_fully_vaccinated_per_hundred": per_hundred / 3,
+            "daily_vaccination_per_million": daily / s["population"] * 1e6,
+            "daily_people_vaccinated": daily // 2,
+            "daily_people_vaccinated_per_hundred": daily / s["population"] * 50,
+        })
+        sq.executemany(f"INSERT INTO Vaccination VALUES ({', '.join('?' * vax.shape[1])});", vax.itertuples(index=False, name=None))
+        counts["Vaccination"] += len(vax)
+
+        # Manufacturer / per-vaccine / age-group tables are weekly, like OWID's
+        weekly = np.flatnonzero(day % 7 == 0)
+        shares = np.random.default_rng([seed, i, 1]).dirichlet(np.ones(vaccines))
+        manu = [
+            (d_sql[w], v, int(total[w] * shares[k]), name)
+            for w in weekly for k, v in enumerate(vaccine_names)
+        ]
+        sq.executemany("INSERT INTO Vaccination_by_manu VALUES (?, ?, ?, ?);", manu)
+        sq.executemany(
+            "INSERT INTO Country_data VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+            [(dd, v, "https://example.invalid", t, t // 2, t // 3, None, c) for dd, v, t, c in manu],
+        )
+        counts["Vaccination_by_manu"] += len(manu)
+        counts["Country_data"] += len(manu)
+        ages = [
+            (d_sql[w], g, float(per_hundred[w] / 2), float(per_hundred[w] / 3), None, name)
+            for w in weekly for g in AGE_GROUPS
+        ]
+        sq.executemany("INSERT INTO Vaccination_age_group VALUES (?, ?, ?, ?, ?, ?);", ages)
+        counts["Vaccination_age_group"] += len(ages)
+
+        csv = pd.DataFrame({
+            "location": name,
+            "iso_code": f"X{i:05d}",
+            "date": iso_dates[day],
+            "total_vaccinations": pd.array(np.where(s["missing"], None, total), dtype="Int64"),
+            "people_vaccinated": total // 2,
+            "people_fully_vaccinated": total // 3,
+            "total_boosters": total // 10,
+            "daily_vaccinations_raw": daily,
+            "daily_vaccinations": daily,
+            "total_vaccinations_per_hundred": per_hundred.round(2),
+            "people_vaccinated_per_hundred": (per_hundred / 2).round(2),
+            "people_fully_vaccinated_per_hundred": (per_hundred / 3).round(2),
+            "daily_vaccinations_per_million": (daily / s["population"] * 1e6).round(),
+            "daily_people_vaccinated": daily // 2,
+            "daily_people_vaccinated_per_hundred": (daily / s["population"] * 50).round(3),
+        }, columns=OWID_CSV_COLUMNS)
+        csv.to_csv(csv_path, mode="a", header=not csv_path.exists(), index=False)
+
+    counts["Location"] = countries
+    sq.commit()
+    sq.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--countries", type=int, default=OWID_COUNTRIES)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies --countries")
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--vaccines", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, default=Path(os.getenv("BENCH_DIR", ".cache/bench")))
+    args = parser.parse_args()
+
+    counts = write_dataset(args.out, round(args.countries * args.scale), args.days, args.vaccines, args.seed)
+    for table, n in counts.items():
+        print(f"  {table}: {n:,} rows")
+    print(f"✅ Synthetic dataset written to {args.out}/ (source.db, vaccinations.csv)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,80 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
+import pyarrow as pa
 import plotly.express as px
 import plotly.graph_objects as go
 from urllib.parse import quote
 
 API = os.getenv("API_URL", "http://127.0.0.1:8000").rstrip("/")
+# Concurrent API calls per page run (also the HTTP connection pool size)
+FETCH_WORKERS = int(os.getenv("DASHBOARD_FETCH_WORKERS", "4"))
 
 st.set_page_config(page_title="VaxPulse — Dashboard", layout="wide")
 st.title("VaxPulse — Vaccination Dashboard")
 
-session = requests.Session()
+@st.cache_resource
+def get_session():
+    # One keep-alive connection pool for the server process, reused across reruns
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 def _get_json(path: str):
-    r = session.get(f"{API}{path}", timeout=25)
+    r = get_session().get(f"{API}{path}", timeout=25)
     r.raise_for_status()
     return r.json()
 
+def _get_frame(path: str):
+    # Arrow IPC stream -> DataFrame (no per-row JSON decoding)
+    sep = "&" if "?" in path else "?"
+    r = get_session().get(f"{API}{path}{sep}format=arrow", timeout=25)
+    r.raise_for_status()
+    return pa.ipc.open_stream(r.content).read_pandas()
+
 @st.cache_data(ttl=600)
 def fetch_countries():
     return _get_json("/countries")
 
 @st.cache_data(ttl=300)
-def fetch_monthly_growth(country: str):
-    return _get_json(f"/kpi/monthly-growth/{country}")
-
-@st.cache_data(ttl=300)
-def fetch_manufacturer_share(country: str):
-    return _get_json(f"/kpi/manufacturer-share/{country}")
+def fetch_country_bundle(country: str):
+    # {"summary": {...}, "monthly_growth": [...], "manufacturer_share": [...], "quality": {...}, "last_updated": "..."}
+    return _get_json(f"/country/{quote(country)}/bundle")
 
-# New endpoints (we'll add in API)
 @st.cache_data(ttl=300)
-def fetch_kpi_summary(country: str):
-    # {"latest_total":..., "latest_growth_rate":..., "peak_growth_rate":..., "as_of": "..."}
-    return _get_json(f"/kpi/summary/{country}")
+def fetch_series(country: str, resolution: str, window: int):
+    # DataFrame[period, total, doses, growth_rate, rolling_growth_rate, rolling_doses]
+    return _get_frame(f"/kpi/series/{quote(country)}?resolution={resolution}&window={window}&max_points=400")
 
 @st.cache_data(ttl=300)
 def fetch_world_map(metric: str, as_of: str | None = None):
-    # [{"country": "...", "iso_code":"AUS", "value": 0.52}, ...]
+    # DataFrame[country, iso_code, value]
     q = f"/map/world?metric={metric}"
     if as_of:
         q += f"&as_of={as_of}"
-    return _get_json(q)
+    return _get_frame(q)
+
+def fetch_all(calls):
+    """
+    Runs {name: (fetch_fn, *args)} concurrently; returns {name: result or the exception raised}.
+    Workers get this run's script context so st.cache_data works inside them.
+    """
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS, initializer=add_script_run_ctx, initargs=(None, ctx)) as pool:
+        futures = {name: pool.submit(fn, *args) for name, (fn, *args) in calls.items()}
+    results = {}
+    for name, f in futures.items():
+        try:
+            results[name] = f.result()
+        except Exception as e:
+            results[name] = e
+    return results
 
 # ---------------- Sidebar ----------------
 with st.sidebar:
@@ -57,24 +89,40 @@ except Exception as e:
 
 country = st.sidebar.selectbox("Select country", countries)
 
-tabs = st.tabs([
+VIEWS = [
     "Campaign Status Report",
     "Key Operational Indicators",
     "Country Comparison",
     "Manufacturer",
     "Data Quality"
-])
-
-# ---------------- Tab 1: Campaign Status Report ----------------
-with tabs[0]:
+]
+METRICS = ["latest_total_vaccinations", "latest_mom_growth_rate"]
+
+# Unlike st.tabs, only the selected view is built (and its data fetched) on a rerun
+view = st.radio("View", VIEWS, horizontal=True, key="view", label_visibility="collapsed")
+
+# Everything this view needs, fetched concurrently. Widget values come from session
+# state (the widgets themselves render further down, with the same defaults).
+calls = {"bundle": (fetch_country_bundle, country)}
+if view == VIEWS[1]:
+    calls["series"] = (fetch_series, country, st.session_state.get("resolution", "month"), st.session_state.get("window", 3))
+elif view == VIEWS[2]:
+    calls["world"] = (fetch_world_map, st.session_state.get("metric", METRICS[0]))
+data = fetch_all(calls)
+
+# One request for everything country-specific (summary, series, manufacturer, quality)
+bundle = data["bundle"]
+if isinstance(bundle, Exception):
+    st.error(f"Country data not available for {country}: {bundle}")
+    bundle = {}
+st.sidebar.caption(f"Last updated: {bundle.get('last_updated') or '—'}")
+
+# ---------------- Campaign Status Report ----------------
+if view == VIEWS[0]:
     st.subheader(f"Campaign Status — {country}")
 
     # KPI tiles (summary endpoint)
-    summary = None
-    try:
-        summary = fetch_kpi_summary(country)
-    except Exception:
-        summary = None
+    summary = bundle.get("summary")
 
     k1, k2, k3, k4 = st.columns(4)
     if summary:
@@ -91,7 +139,7 @@ with tabs[0]:
         k4.metric("As of", "—")
 
     # Trends
-    mg = pd.DataFrame(fetch_monthly_growth(country))
+    mg = pd.DataFrame(bundle.get("monthly_growth", []))
     if not mg.empty:
         mg["month"] = pd.to_datetime(mg["month"])
         c1, c2 = st.columns(2)
@@ -122,35 +170,51 @@ with tabs[0]:
             use_container_width=True
         )
 
-# ---------------- Tab 2: Key Operational Indicators ----------------
-with tabs[1]:
+# ---------------- Key Operational Indicators ----------------
+elif view == VIEWS[1]:
     st.subheader("Key Operational Indicators")
     st.caption("Add operational KPIs (dose per 100, boosters %, rolling avg, etc.)")
 
-    mg = pd.DataFrame(fetch_monthly_growth(country))
-    if not mg.empty:
-        mg["month"] = pd.to_datetime(mg["month"])
-        mg["rolling_3m_growth"] = mg["growth_rate"].rolling(3).mean()
+    r1, r2 = st.columns(2)
+    resolution = r1.selectbox("Resolution", ["month", "week", "day"], index=0, key="resolution")
+    window = r2.slider("Rolling window (periods)", min_value=1, max_value=12, value=3, key="window")
 
+    # Aggregated, rolled and downsampled server-side (/kpi/series)
+    ts = data["series"]
+    if isinstance(ts, Exception):
+        st.error(f"Series not available for {country}: {ts}")
+    elif not ts.empty:
+        ts["period"] = pd.to_datetime(ts["period"])
         st.plotly_chart(
-            px.line(mg.dropna(subset=["rolling_3m_growth"]), x="month", y="rolling_3m_growth",
-                    title="Rolling 3-month growth rate"),
+            px.line(ts.dropna(subset=["rolling_growth_rate"]), x="period", y="rolling_growth_rate",
+                    title=f"Rolling {window}-{resolution} growth rate"),
             use_container_width=True
         )
+        if ts["rolling_doses"].notna().any():
+            st.plotly_chart(
+                px.line(ts.dropna(subset=["rolling_doses"]), x="period", y="rolling_doses",
+                        title=f"Rolling {window}-{resolution} average doses per {resolution}"),
+                use_container_width=True
+            )
+    else:
+        st.info("No series available for this country.")
 
-# ---------------- Tab 3: Country Comparison (World map + top countries) ----------------
-with tabs[2]:
+# ---------------- Country Comparison (World map + top countries) ----------------
+elif view == VIEWS[2]:
     st.subheader("Country Comparison (World)")
 
     metric = st.selectbox(
         "Metric",
-        ["latest_total_vaccinations", "latest_mom_growth_rate"],
-        index=0
+        METRICS,
+        index=0,
+        key="metric"
     )
 
     # world choropleth (requires /map/world)
     try:
-        wm = pd.DataFrame(fetch_world_map(metric))
+        wm = data["world"]
+        if isinstance(wm, Exception):
+            raise wm
         if not wm.empty:
             fig = px.choropleth(
                 wm,
@@ -169,11 +233,11 @@ with tabs[2]:
         st.info("World map endpoint not available yet. Add `/map/world` in API.")
         st.caption(f"Details: {e}")
 
-# ---------------- Tab 4: Manufacturer ----------------
-with tabs[3]:
+# ---------------- Manufacturer ----------------
+elif view == VIEWS[3]:
     st.subheader(f"Manufacturer — {country}")
 
-    ms = pd.DataFrame(fetch_manufacturer_share(country))
+    ms = pd.DataFrame(bundle.get("manufacturer_share", []))
     if not ms.empty:
         st.plotly_chart(
             px.bar(ms, x="vaccine", y="total", title="Top manufacturers (latest snapshot)"),
@@ -182,13 +246,13 @@ with tabs[3]:
     else:
         st.info("No manufacturer data for this country.")
 
-# ---------------- Tab 5: Data Quality ----------------
-with tabs[4]:
+# ---------------- Data Quality ----------------
+elif view == VIEWS[4]:
     st.subheader("Data Quality")
     st.caption("Missing months, null rates, and freshness indicators.")
 
-    try:
-        q = _get_json(f"/quality/summary/{quote(country)}")
+    q = bundle.get("quality")
+    if q:
         c1, c2, c3, c4 = st.columns(4)
 
         c1.metric("Country", q.get("country", country))
@@ -202,6 +266,5 @@ with tabs[4]:
         )
 
         st.json(q)  # optional: remove later
-    except Exception as e:
-        st.error(f"Quality endpoint failed for {country}: {e}")
-        st.info("Check API_URL in Streamlit env vars and ensure the endpoint exists.")
+    else:
+        st.info(f"No quality summary available for {country}.")
@@ -0,0 +1,243 @@
+"""
+Streams the OWID vaccinations.csv (local path or URL) straight into `location` and
+`vaccination`, without the intermediate SQLite file.
+
+    python -m ingestion.ingest_owid_csv_to_postgres [path-or-url]
+
+Chunks are converted and COPY-encoded with vectorised pandas/numpy ops, COPY'd into a
+staging table and merged with INSERT ... ON CONFLICT in one transaction. With
+INGEST_MODE=incremental only rows newer than each country's watermark are kept; with
+full (the default) the CSV replaces the OWID-sourced data, so rows and countries
+removed upstream are deleted too.
+"""
+import os
+import sys
+import time
+import pandas as pd
+import psycopg
+
+from ingestion.ingest_sqlite_to_postgres import (
+    INGEST_CHUNK_SIZE,
+    INGEST_MODE,
+    TABLES,
+    advance_watermarks,
+    bump_data_version,
+    copy_chunks,
+    create_stage,
+    ensure_partitions,
+    merge_stage,
+    peak_rss_mb,
+    record_ingest_run,
+    read_watermarks,
+    refresh_country_quality,
+    refresh_monthly_summary,
+    report_table,
+)
+
+OWID_VAX_CSV_URL = os.environ.get(
+    "OWID_VAX_CSV_URL",
+    "https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/vaccinations/vaccinations.csv",
+)
+OWID_SOURCE_NAME = "Our World in Data"
+
+# OWID column -> vaccination column
+OWID_COLUMNS = {
+    "date": "date",
+    "location": "location",
+    "total_vaccinations": "total_vaccination",
+    "people_vaccinated": "people_vaccinated",
+    "people_fully_vaccinated": "people_fully_vaccinated",
+    "total_boosters": "total_boosters",
+    "daily_vaccinations_raw": "daily_vaccinations_raw",
+    "daily_vaccinations": "daily_vaccination",
+    "total_vaccinations_per_hundred": "total_vaccination_per_hundred",
+    "people_vaccinated_per_hundred": "people_vaccinated_per_hundred",
+    "people_fully_vaccinated_per_hundred": "people_fully_vaccinated_per_hundred",
+    "daily_vaccinations_per_million": "daily_vaccination_per_million",
+    "daily_people_vaccinated": "daily_people_vaccinated",
+    "daily_people_vaccinated_per_hundred": "daily_people_vaccinated_per_hundred",
+}
+
+LOCATION_COLUMNS = dict(TABLES[0][2])
+VACCINATION_COLUMNS = TABLES[1][2]
+
+
+def read_owid_chunks(source: str, chunk_size: int = INGEST_CHUNK_SIZE):
+    """
+    Streams the CSV as DataFrames renamed to vaccination columns (plus iso_code); numeric
+    columns are parsed as float64 by the C parser (missing ones are filled with NaN).
+    """
+    numeric = [c for c in OWID_COLUMNS if c not in ("date", "location")]
+    reader = pd.read_csv(
+        source,
+        usecols=lambda c: c in OWID_COLUMNS or c == "iso_code",
+        dtype={"location": "string", "date": "string", "iso_code": "string", **{c: "float64" for c in numeric}},
+        chunksize=chunk_size,
+    )
+    for chunk in reader:
+        chunk = chunk.rename(columns=OWID_COLUMNS)
+        for name, _ in VACCINATION_COLUMNS:
+            if name not in chunk.columns:
+                chunk[name] = float("nan")
+        if "iso_code" not in chunk.columns:
+            chunk["iso_code"] = pd.Series(pd.NA, index=chunk.index, dtype="string")
+        yield chunk
+
+
+def _drop_unloadable(chunk: pd.DataFrame, skipped: dict, aggregates: dict):
+    """
+    Drops OWID_* aggregates (World, continents, income groups: not countries) and rows
+    without a location or a parseable date (both NOT NULL); counts them in `skipped`
+    and collects the aggregates' {location: iso_code} in `aggregates`.
+    """
+    aggregate = chunk["iso_code"].str.startswith("OWID_").fillna(False).to_numpy(dtype=bool)
+    dates = pd.to_datetime(chunk["date"], format="%Y-%m-%d", errors="coerce")
+    invalid = ~aggregate & (dates.isna() | chunk["location"].isna()).to_numpy()
+    skipped["aggregate"] += int(aggregate.sum())
+    named = chunk[aggregate & chunk["location"].notna().to_numpy()]
+    aggregates.update(zip(named["location"], named["iso_code"]))
+    skipped["invalid"] += int(invalid.sum())
+    return chunk[~(aggregate | invalid)]
+
+
+def _newer_than_watermarks(chunk: pd.DataFrame, watermarks: dict):
+    # Vectorised per-country filter: date > watermark (countries without one keep every row)
+    dates = pd.to_datetime(chunk["date"], format="%Y-%m-%d", errors="coerce")
+    floor = pd.to_datetime(chunk["location"].map(watermarks))
+    return chunk[floor.isna() | (dates > floor)]
+
+
+def _remove_dropped_upstream(pg):
+    """
+    Full mode: deletes vaccination rows of OWID-sourced countries that this load no longer
+    has, and the location rows of countries it no longer lists (unless other tables still
+    reference them). Their watermarks, monthly summaries and quality rows are cleared for
+    a rebuild. Leaves TEMP table owid_countries; returns (vaccination rows, location rows)
+    deleted. No commit.
+    """
+    pg.execute("CREATE TEMP TABLE owid_countries (country_name TEXT PRIMARY KEY) ON COMMIT DROP;")
+    pg.execute("INSERT INTO owid_countries SELECT country_name FROM location WHERE source_name = %s;", (OWID_SOURCE_NAME,))
+    deleted = pg.execute("""
+        DELETE FROM vaccination v
+        USING owid_countries c
+        WHERE v.location = c.country_name
+          AND NOT EXISTS (SELECT 1 FROM stage_vaccination s WHERE s.location = v.location AND s.date = v.date);
+    """).rowcount
+    for table in ("country_monthly_summary", "country_quality"):
+        pg.execute(f"DELETE FROM {table} WHERE country_name IN (SELECT country_name FROM owid_countries);")
+    pg.execute("""
+        DELETE FROM ingest_watermark
+        WHERE table_name = 'vaccination' AND country_name IN (SELECT country_name FROM owid_countries);
+    """)
+    locations = pg.execute("""
+        DELETE FROM location l
+        USING owid_countries c
+        WHERE l.country_name = c.country_name
+          AND NOT EXISTS (SELECT 1 FROM stage_location s WHERE s.country_name = l.country_name)
+          AND NOT EXISTS (SELECT 1 FROM country_data d WHERE d.country_name = l.country_name)
+          AND NOT EXISTS (SELECT 1 FROM vaccination_age_group a WHERE a.country_name = l.country_name)
+          AND NOT EXISTS (SELECT 1 FROM vaccination_by_manu m WHERE m.country_name = l.country_name);
+    """).rowcount
+    return deleted, locations
+
+
+def load_owid_csv(pg, source: str, incremental: bool):
+    """
+    Stages every chunk, then upserts `location` (FK parent) before `vaccination`; a full
+    load also removes what the CSV no longer has. Returns [(table, rows, seconds)]; the
+    caller commits.
+    """
+    t0 = time.perf_counter()
+    watermarks = dict(read_watermarks(pg, "vaccination")) if incremental else {}
+    last_dates = {}
+    skipped = {"aggregate": 0, "invalid": 0}
+    aggregates = {}
+
+    ensure_partitions(pg)
+    create_stage(pg, "vaccination")
+    n = 0
+
+    def chunks():
+        nonlocal n
+        for chunk in read_owid_chunks(source):
+            chunk = _drop_unloadable(chunk, skipped, aggregates)
+            if watermarks:
+                chunk = _newer_than_watermarks(chunk, watermarks)
+            for location, d in chunk.groupby("location")["date"].max().items():
+                last_dates[location] = max(d, last_dates.get(location, d))
+            n += len(chunk)
+            yield chunk
+
+    copy_chunks(pg, "stage_vaccination", VACCINATION_COLUMNS, chunks(), date_format="%Y-%m-%d")
+    extract_elapsed = time.perf_counter() - t0
+    print(
+        f"  skipped {skipped['aggregate']:,} OWID_* aggregate row(s) and "
+        f"{skipped['invalid']:,} row(s) without a location or valid date"
+    )
+
+    # Lets DB-backed views (e.g. the world map) tell aggregates apart without OWID
+    with pg.cursor() as cur:
+        cur.executemany(
+            "INSERT INTO non_country_location (country_name, iso_code) VALUES (%s, %s) ON CONFLICT DO NOTHING;",
+            list(aggregates.items()),
+        )
+        changed = max(cur.rowcount, 0)
+
+    # location first: vaccination references it
+    t1 = time.perf_counter()
+    create_stage(pg, "location")
+    # A local path is a downloaded copy: record where the data actually comes from
+    loc = pd.DataFrame({
+        "country_name": list(last_dates),
+        "last_observation_date": list(last_dates.values()),
+        "source_name": OWID_SOURCE_NAME,
+        "source_url": source if source.startswith(("http://", "https://")) else OWID_VAX_CSV_URL,
+    })
+    location_columns = list(LOCATION_COLUMNS.items())
+    n_loc = copy_chunks(pg, "stage_location", location_columns, [loc], date_format="%Y-%m-%d")
+    changed += merge_stage(pg, "location", list(LOCATION_COLUMNS))
+    location_elapsed = time.perf_counter() - t1
+
+    t2 = time.perf_counter()
+    changed += merge_stage(pg, "vaccination", [name for name, _ in VACCINATION_COLUMNS])
+    scope = "stage_vaccination"
+    if not incremental:
+        deleted, deleted_locations = _remove_dropped_upstream(pg)
+        changed += deleted + deleted_locations
+        print(f"  removed {deleted:,} vaccination row(s) no longer in the CSV")
+        # Summaries of these countries were cleared: rebuild them from all their rows
+        scope = "(SELECT location, date FROM vaccination WHERE location IN (SELECT country_name FROM owid_countries)) owid"
+    advance_watermarks(pg, "vaccination", "location")
+    refresh_monthly_summary(pg, scope=scope)
+    refresh_country_quality(pg, scope=scope)
+    # A run that changed nothing keeps API caches and ETags valid
+    if changed:
+        bump_data_version(pg)
+    return [
+        ("location", n_loc, location_elapsed),
+        ("vaccination", n, extract_elapsed + time.perf_counter() - t2),
+    ]
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else OWID_VAX_CSV_URL
+    pg_dsn = os.environ["PG_DSN"]
+
+    t_start = time.perf_counter()
+    with psycopg.connect(pg_dsn) as pg:
+        results = load_owid_csv(pg, source, incremental=(INGEST_MODE == "incremental"))
+        record_ingest_run(pg, "owid_csv", INGEST_MODE, results)
+    for r in results:
+        report_table(*r)
+
+    total_rows = sum(n for _, n, _ in results)
+    elapsed = time.perf_counter() - t_start
+    print(f"✅ OWID ingestion complete ({INGEST_MODE}): {total_rows:,} rows in {elapsed:.2f}s from {source}.")
+    own, _ = peak_rss_mb()
+    print(f"   Peak RSS: {own:,.0f} MB (chunk size {INGEST_CHUNK_SIZE:,}).")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    main()
@@ -1,131 +1,563 @@
 import os
+import time
 import sqlite3
+import resource
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import psycopg
-from datetime import datetime
 
-def parse_ddmmyyyy_to_date(s: str):
-    if s is None:
-        return None
-    # SQLite has dd/mm/yyyy strings
-    return datetime.strptime(s, "%d/%m/%Y").date()
+# Tables after `location` only depend on it, so they load concurrently on separate
+# connections/processes. INGEST_REBUILD_INDEXES drops secondary indexes for the load.
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "4"))
+INGEST_REBUILD_INDEXES = os.environ.get("INGEST_REBUILD_INDEXES", "false").lower() in ("1", "true", "yes")
+# Rows per extraction chunk; bounds memory per worker regardless of table size
+INGEST_CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", "50000"))
+# full: TRUNCATE + reload; incremental: upsert rows newer than each country's watermark
+INGEST_MODE = os.environ.get("INGEST_MODE", "full").lower()
+
+# Target tables in load order (location first: the others reference it).
+# (postgres table, sqlite table, [(column, postgres type), ...]) - column names match in both DBs.
+TABLES = [
+    ("location", "Location", [
+        ("country_name", "text"), ("last_observation_date", "date"), ("source_name", "text"), ("source_url", "text"),
+    ]),
+    ("vaccination", "Vaccination", [
+        ("date", "date"), ("location", "text"),
+        ("total_vaccination", "int8"), ("people_vaccinated", "int8"), ("people_fully_vaccinated", "int8"),
+        ("total_boosters", "int8"), ("daily_vaccinations_raw", "int8"), ("daily_vaccination", "int8"),
+        ("total_vaccination_per_hundred", "float8"), ("people_vaccinated_per_hundred", "float8"),
+        ("people_fully_vaccinated_per_hundred", "float8"), ("daily_vaccination_per_million", "float8"),
+        ("daily_people_vaccinated", "int8"), ("daily_people_vaccinated_per_hundred", "float8"),
+    ]),
+    ("country_data", "Country_data", [
+        ("date", "date"), ("vaccine", "text"), ("source_url", "text"),
+        ("total_vaccinated", "int8"), ("people_vaccinated", "int8"), ("people_fully_vaccinated", "int8"),
+        ("total_boosters", "int8"), ("country_name", "text"),
+    ]),
+    ("vaccination_age_group", "Vaccination_age_group", [
+        ("date", "date"), ("age_group", "text"), ("people_vaccinated_per_hundred", "float8"),
+        ("people_fully_vaccinated_per_hundred", "float8"), ("people_with_booster_per_hundred", "float8"),
+        ("country_name", "text"),
+    ]),
+    ("vaccination_by_manu", "Vaccination_by_manu", [
+        ("date", "date"), ("vaccine", "text"), ("total_vaccinations", "int8"), ("country_name", "text"),
+    ]),
+]
+
+# Primary keys (ON CONFLICT targets) and the country column of each table
+KEYS = {
+    "location": ("country_name",),
+    "vaccination": ("date", "location"),
+    "country_data": ("country_name", "date", "vaccine"),
+    "vaccination_age_group": ("country_name", "date", "age_group"),
+    "vaccination_by_manu": ("country_name", "date", "vaccine"),
+}
+COUNTRY_COLUMN = {"vaccination": "location"}
+
+
+def extract_chunks(sq, source: str, chunk_size: int = INGEST_CHUNK_SIZE, query=None):
+    """
+    Streams a SQLite table (or `query`) as DataFrames of at most `chunk_size` rows
+    (cursor.fetchmany underneath).
+    """
+    yield from pd.read_sql_query(query or f"SELECT * FROM {source}", sq, chunksize=chunk_size)
+
+
+# COPY ... (FORMAT BINARY) framing: signature + flags + header extension length, and
+# the end-of-data marker (a -1 field count). Rows are written between them in blocks.
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + bytes(8)
+COPY_BINARY_TRAILER = b"\xff\xff"
+PG_EPOCH = np.datetime64("2000-01-01", "D")
+BINARY_WIDTH = {"date": ">i4", "int8": ">i8", "float8": ">f8"}
+
+
+def _binary_field(col: pd.Series, pg_type: str, date_format: str):
+    """
+    One column as COPY binary field slots: a (rows, 4 + width) uint8 matrix of int32
+    length (-1 = NULL) + big-endian value, and a mask of the bytes to keep (None = all).
+    Date strings -> days since 2000-01-01, integer columns are rounded, NaN/NaT -> NULL.
+    """
+    n = len(col)
+    if pg_type == "text":
+        valid = col.notna().to_numpy()
+        data = [str(v).encode() if ok else b"" for v, ok in zip(col.to_numpy(), valid)]
+        lengths = np.fromiter(map(len, data), dtype=np.int64, count=n)
+        width = max(int(lengths.max(initial=0)), 1)
+        values = np.array(data, dtype=f"S{width}").view(np.uint8).reshape(n, width)
+        keep = np.arange(width) < lengths[:, None]
+    else:
+        if pg_type == "date":
+            # A chunk holds few distinct dates: parse each once (code -1 = missing)
+            codes, uniques = pd.factorize(col)
+            dates = pd.to_datetime(pd.Series(uniques, dtype=object), format=date_format, errors="coerce")
+            days = (dates.to_numpy().astype("datetime64[D]") - PG_EPOCH).astype(np.int64)
+            raw = np.append(days, 0)[codes]
+            valid = np.append(dates.notna().to_numpy(), False)[codes]
+        elif pd.api.types.is_integer_dtype(col.dtype) and not col.hasnans:
+            raw, valid = col.to_numpy(dtype=np.int64), np.ones(n, dtype=bool)
+        else:
+            raw = pd.to_numeric(col, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = np.isfinite(raw) if pg_type == "int8" else ~np.isnan(raw)
+            if pg_type == "int8":
+                raw = np.round(raw)
+        dtype = np.dtype(BINARY_WIDTH[pg_type])
+        width = dtype.itemsize
+        values = np.where(valid, raw, 0).astype(dtype).view(np.uint8).reshape(n, width)
+        lengths = np.where(valid, width, 0)
+        keep = None if valid.all() else np.repeat(valid[:, None], width, axis=1)
+
+    header = np.where(valid, lengths, -1).astype(">i4").view(np.uint8).reshape(n, 4)
+    slots = np.hstack([header, values])
+    if keep is not None:
+        keep = np.hstack([np.ones((n, 4), dtype=bool), keep])
+    return slots, keep
+
+
+def encode_copy_chunk(df: pd.DataFrame, columns, date_format: str = "%d/%m/%Y") -> bytes:
+    """
+    Vectorised COPY binary encoding of a whole extract (tuples only, no header/trailer):
+    every column is converted and laid out with numpy, then the padding bytes of NULLs
+    and short strings are dropped in one boolean-mask pass.
+    """
+    n = len(df)
+    field_count = np.empty((n, 2), dtype=np.uint8)
+    field_count[:] = np.frombuffer(np.array(len(columns), dtype=">i2").tobytes(), dtype=np.uint8)
+    slots, keeps, masked = [field_count], [np.ones((n, 2), dtype=bool)], False
+    for name, pg_type in columns:
+        field, keep = _binary_field(df[name], pg_type, date_format)
+        masked |= keep is not None
+        slots.append(field)
+        keeps.append(np.ones(field.shape, dtype=bool) if keep is None else keep)
+    rows = np.hstack(slots)
+    return (rows[np.hstack(keeps)] if masked else rows).tobytes()
+
+
+def copy_chunks(pg, table: str, columns, chunks, date_format: str = "%d/%m/%Y"):
+    """
+    Streams DataFrame `chunks` into `table` with one COPY ... FROM STDIN (FORMAT BINARY),
+    one encoded buffer per chunk. Returns the number of rows written.
+    """
+    names = ", ".join(name for name, _ in columns)
+    n = 0
+    with pg.cursor() as cur:
+        with cur.copy(f"COPY {table} ({names}) FROM STDIN (FORMAT BINARY)") as copy:
+            copy.write(COPY_BINARY_HEADER)
+            for chunk in chunks:
+                if len(chunk):
+                    copy.write(encode_copy_chunk(chunk, columns, date_format))
+                    n += len(chunk)
+            copy.write(COPY_BINARY_TRAILER)
+    return n
 
-def main():
-    sqlite_path = os.environ.get("SQLITE_PATH", "assets/Vaccinations.db")
-    pg_dsn = os.environ["PG_DSN"]
 
+def load_table(sqlite_path: str, pg_dsn: str, table: str, source: str, columns):
+    """
+    Loads one table on its own SQLite + Postgres connections (runs in a worker process).
+    Returns (table, rows, seconds).
+    """
+    t0 = time.perf_counter()
     sq = sqlite3.connect(sqlite_path)
-    pg = psycopg.connect(pg_dsn)
+    with psycopg.connect(pg_dsn) as pg:
+        # Chunks flow straight into one COPY stream; only one chunk is in memory at a time
+        n = copy_chunks(pg, table, columns, extract_chunks(sq, source))
+    sq.close()
+    return table, n, time.perf_counter() - t0
 
-    # Load tables from SQLite
-    tables = ["Location", "Vaccination", "Country_data", "Vaccination_age_group", "Vaccination_by_manu"]
+
+def drop_secondary_indexes(pg, tables):
+    """
+    Drops non-constraint indexes on `tables`; returns (name, indexdef) pairs to re-create after the load.
+    """
+    with pg.cursor() as cur:
+        cur.execute("""
+            SELECT i.indexname, i.indexdef
+            FROM pg_indexes i
+            WHERE i.schemaname = current_schema()
+              AND i.tablename = ANY(%s)
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname);
+        """, (list(tables),))
+        # Indexes on a partitioned table are reported "ON ONLY <table>"; re-creating them
+        # that way would leave the partitions unindexed
+        indexes = [(name, indexdef.replace(" ON ONLY ", " ON ")) for name, indexdef in cur.fetchall()]
+        for name, _ in indexes:
+            cur.execute(f"DROP INDEX IF EXISTS {name};")
+    pg.commit()
+    return indexes
+
+
+def ensure_partitions(pg):
+    """
+    Creates any missing yearly partitions of the fact tables (sql/migrations/008), up to a
+    year ahead, so new dates never pile up in the <table>_default partitions. No commit.
+    """
+    pg.execute("SELECT vaxpulse_ensure_partitions(DATE '2020-01-01', (CURRENT_DATE + interval '1 year')::date);")
+
+
+def run_sql(pg_dsn: str, sql: str):
+    t0 = time.perf_counter()
+    with psycopg.connect(pg_dsn) as pg:
+        pg.execute(sql)
+    return time.perf_counter() - t0
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of the largest (finished) worker process, in MB."""
+    scale = 1024 * 1024 if os.uname().sysname == "Darwin" else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, workers
+
+
+def report_table(table, n, elapsed):
+    print(f"  {table}: {n:,} rows in {elapsed:.2f}s ({n / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+def _dated_tables():
+    # (table, country column) for every table with a per-country date series
+    return [(table, COUNTRY_COLUMN.get(table, "country_name")) for table, _, _ in TABLES if table != "location"]
+
+
+def run_full(sqlite_path: str, pg_dsn: str):
+    """
+    TRUNCATE + parallel COPY reload of every table. Returns [(table, rows, seconds)].
+    """
+    pg = psycopg.connect(pg_dsn)
 
     with pg.cursor() as cur:
         # Clear existing (idempotent dev workflow)
         cur.execute("TRUNCATE vaccination_by_manu, vaccination_age_group, country_data, vaccination RESTART IDENTITY;")
         cur.execute("TRUNCATE location RESTART IDENTITY CASCADE;")
+        ensure_partitions(pg)
         pg.commit()
 
-    # 1) Location
-    loc = pd.read_sql_query("SELECT * FROM Location", sq)
-    if "last_observation_date" in loc.columns:
-        # may already be ISO; if not, leave as text and let Postgres cast best-effort
-       loc["last_observation_date"] = pd.to_datetime(
-    loc["last_observation_date"], format="%d/%m/%Y", errors="coerce"
-).dt.date
+    dropped = []
+    if INGEST_REBUILD_INDEXES:
+        dropped = drop_secondary_indexes(pg, [table for table, _, _ in TABLES])
+        print(f"Dropped {len(dropped)} secondary index(es) for the load")
 
+    results = []
+    with ProcessPoolExecutor(max_workers=max(INGEST_WORKERS, 1)) as pool:
+        try:
+            # 1) location first: every other table has a foreign key to it
+            (root, root_source, root_columns), rest = TABLES[0], TABLES[1:]
+            results.append(load_table(sqlite_path, pg_dsn, root, root_source, root_columns))
+            report_table(*results[-1])
 
-    with pg.cursor() as cur:
-        for r in loc.itertuples(index=False):
-            cur.execute(
-                """
-                INSERT INTO location(country_name, last_observation_date, source_name, source_url)
-                VALUES (%s,%s,%s,%s)
-                """,
-                (r.country_name, r.last_observation_date, r.source_name, r.source_url),
-            )
-        pg.commit()
+            # 2) the remaining tables concurrently
+            futures = [pool.submit(load_table, sqlite_path, pg_dsn, table, source, columns) for table, source, columns in rest]
+            for f in futures:
+                results.append(f.result())
+                report_table(*results[-1])
+        finally:
+            # 3) rebuild dropped indexes (also in parallel), even if a load failed
+            rebuilds = [(name, pool.submit(run_sql, pg_dsn, indexdef)) for name, indexdef in dropped]
+            for name, f in rebuilds:
+                print(f"  rebuilt {name} in {f.result():.2f}s")
 
-    # 2) Vaccination
-    v = pd.read_sql_query("SELECT * FROM Vaccination", sq)
-    v["date"] = v["date"].apply(parse_ddmmyyyy_to_date)
+    # TRUNCATE ... CASCADE emptied the derived tables; rebuild them from the new data
+    refresh_monthly_summary(pg, scope="vaccination")
+    refresh_country_quality(pg, scope="vaccination")
+    refresh_manufacturer_latest(pg, scope="vaccination_by_manu")
+    bump_data_version(pg)
 
+    # Seed watermarks so the next incremental run starts from here
     with pg.cursor() as cur:
-        for r in v.itertuples(index=False):
-            cur.execute(
-                """
-                INSERT INTO vaccination(
-                  date, location, total_vaccination, people_vaccinated, people_fully_vaccinated, total_boosters,
-                  daily_vaccinations_raw, daily_vaccination, total_vaccination_per_hundred,
-                  people_vaccinated_per_hundred, people_fully_vaccinated_per_hundred, daily_vaccination_per_million,
-                  daily_people_vaccinated, daily_people_vaccinated_per_hundred
-                ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                """,
-                (
-                    r.date, r.location, r.total_vaccination, r.people_vaccinated, r.people_fully_vaccinated, r.total_boosters,
-                    r.daily_vaccinations_raw, r.daily_vaccination, r.total_vaccination_per_hundred,
-                    r.people_vaccinated_per_hundred, r.people_fully_vaccinated_per_hundred, r.daily_vaccination_per_million,
-                    r.daily_people_vaccinated, r.daily_people_vaccinated_per_hundred
-                ),
-            )
-        pg.commit()
+        cur.execute("DELETE FROM ingest_watermark;")
+        for table, country in _dated_tables():
+            cur.execute(f"""
+                INSERT INTO ingest_watermark(table_name, country_name, last_date)
+                SELECT %s, {country}, MAX(date) FROM {table} WHERE date IS NOT NULL GROUP BY {country};
+            """, (table,))
+    record_ingest_run(pg, "sqlite", "full", results)
+    pg.commit()
+    pg.close()
+    return results
 
-    # 3) Country_data
-    cd = pd.read_sql_query("SELECT * FROM Country_data", sq)
-    cd["date"] = cd["date"].apply(parse_ddmmyyyy_to_date)
 
+def read_watermarks(pg, table: str):
     with pg.cursor() as cur:
-        for r in cd.itertuples(index=False):
-            cur.execute(
-                """
-                INSERT INTO country_data(
-                  date, vaccine, source_url, total_vaccinated, people_vaccinated, people_fully_vaccinated, total_boosters, country_name
-                ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
-                """,
-                (
-                    r.date, r.vaccine, r.source_url, r.total_vaccinated, r.people_vaccinated, r.people_fully_vaccinated, r.total_boosters, r.country_name
-                ),
-            )
-        pg.commit()
+        cur.execute("SELECT country_name, last_date FROM ingest_watermark WHERE table_name = %s;", (table,))
+        return cur.fetchall()
 
-    # 4) Vaccination_age_group
-    ag = pd.read_sql_query("SELECT * FROM Vaccination_age_group", sq)
-    ag["date"] = ag["date"].apply(parse_ddmmyyyy_to_date)
 
-    with pg.cursor() as cur:
-        for r in ag.itertuples(index=False):
-            cur.execute(
-                """
-                INSERT INTO vaccination_age_group(
-                  date, age_group, people_vaccinated_per_hundred, people_fully_vaccinated_per_hundred,
-                  people_with_booster_per_hundred, country_name
-                ) VALUES (%s,%s,%s,%s,%s,%s)
-                """,
-                (
-                    r.date, r.age_group, r.people_vaccinated_per_hundred, r.people_fully_vaccinated_per_hundred,
-                    r.people_with_booster_per_hundred, r.country_name
-                ),
-            )
-        pg.commit()
+def _incremental_query(sq, source: str, country: str, watermarks):
+    """
+    SQLite query returning only rows newer than their country's watermark.
+    Watermarks go into a TEMP table, so the SQLite file itself is never written.
+    """
+    sq.execute("DROP TABLE IF EXISTS temp.watermark;")
+    sq.execute("CREATE TEMP TABLE watermark (country TEXT PRIMARY KEY, last INTEGER NOT NULL);")
+    sq.executemany(
+        "INSERT INTO temp.watermark VALUES (?, ?);",
+        [(c, d.year * 10000 + d.month * 100 + d.day) for c, d in watermarks],
+    )
+    # SQLite dates are d/m/yyyy strings, not always zero-padded (1/2/2021): compare
+    # them as the integer yyyymmdd built from their parts
+    return f"""
+        SELECT s.*
+        FROM {source} s
+        LEFT JOIN temp.watermark w ON w.country = s.{country}
+        WHERE w.last IS NULL OR (
+          SELECT CAST(substr(rest, instr(rest, '/') + 1) AS INTEGER) * 10000
+               + CAST(substr(rest, 1, instr(rest, '/') - 1) AS INTEGER) * 100
+               + CAST(substr(s.date, 1, instr(s.date, '/') - 1) AS INTEGER)
+          FROM (SELECT substr(s.date, instr(s.date, '/') + 1) AS rest)
+        ) > w.last
+    """
+
+
+def upsert_table(pg, sq, table: str, source: str, columns):
+    """
+    Stages new rows with COPY and merges them with INSERT ... ON CONFLICT DO UPDATE
+    on the table's primary key; advances the table's watermarks. Returns
+    ((table, rows, seconds), rows changed). No commit.
+    """
+    t0 = time.perf_counter()
+    names = [name for name, _ in columns]
+    stage = f"stage_{table}"
+
+    query = None
+    if table != "location":
+        country = COUNTRY_COLUMN.get(table, "country_name")
+        query = _incremental_query(sq, source, country, read_watermarks(pg, table))
+
+    create_stage(pg, table)
+    n = copy_chunks(pg, stage, columns, extract_chunks(sq, source, query=query))
+    changed = merge_stage(pg, table, names)
+    if table != "location":
+        advance_watermarks(pg, table, country)
+    return (table, n, time.perf_counter() - t0), changed
+
+
+def create_stage(pg, table: str):
+    """TEMP staging table `stage_<table>` shaped like `table`, dropped at commit."""
+    pg.execute(f"CREATE TEMP TABLE stage_{table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP;")
+
+
+def merge_stage(pg, table: str, names):
+    """
+    INSERT ... ON CONFLICT DO UPDATE from stage_<table> into `table` on its primary key.
+    Rows whose values are unchanged are not rewritten; returns the number of rows
+    inserted or updated.
+    """
+    key = ", ".join(KEYS[table])
+    values = [c for c in names if c not in KEYS[table]]
+    conflict = "NOTHING"
+    if values:
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in values)
+        differs = " OR ".join(f"t.{c} IS DISTINCT FROM EXCLUDED.{c}" for c in values)
+        conflict = f"UPDATE SET {updates} WHERE {differs}"
+    return pg.execute(f"""
+        INSERT INTO {table} AS t ({", ".join(names)})
+        SELECT DISTINCT ON ({key}) {", ".join(names)}
+        FROM stage_{table}
+        ON CONFLICT ({key}) DO {conflict};
+    """).rowcount
+
+
+def advance_watermarks(pg, table: str, country: str):
+    """Moves each country's watermark for `table` up to the newest date in stage_<table>."""
+    pg.execute(f"""
+        INSERT INTO ingest_watermark(table_name, country_name, last_date)
+        SELECT %s, {country}, MAX(date) FROM stage_{table} GROUP BY {country}
+        ON CONFLICT (table_name, country_name) DO UPDATE
+        SET last_date = GREATEST(ingest_watermark.last_date, EXCLUDED.last_date),
+            updated_at = now();
+    """, (table,))
+
+
+def refresh_monthly_summary(pg, scope: str = "vaccination"):
+    """
+    Recomputes country_monthly_summary for the (country, month) pairs present in `scope`
+    (a staging table after an incremental load, or `vaccination` after a full one), then
+    MoM growth for those countries from their earliest touched month onwards. No commit.
+    """
+    t0 = time.perf_counter()
+    months = pg.execute(f"""
+        WITH affected AS (
+          SELECT DISTINCT location AS country_name, date_trunc('month', date)::date AS month
+          FROM {scope}
+        )
+        INSERT INTO country_monthly_summary (country_name, month, month_end_total_vaccinations, growth_rate, daily_rows)
+        SELECT a.country_name, a.month, MAX(v.total_vaccination), NULL, COUNT(*)
+        FROM affected a
+        JOIN vaccination v
+          ON v.location = a.country_name
+         AND v.date >= a.month
+         AND v.date < a.month + interval '1 month'
+        GROUP BY a.country_name, a.month
+        ON CONFLICT (country_name, month) DO UPDATE
+        SET month_end_total_vaccinations = EXCLUDED.month_end_total_vaccinations,
+            growth_rate = NULL,
+            daily_rows = EXCLUDED.daily_rows;
+    """)
+    # Growth of month m depends on the previous observed month, so the window runs over
+    # each affected country's full history but only rows from the first touched month change
+    pg.execute(f"""
+        WITH touched AS (
+          SELECT location AS country_name, date_trunc('month', MIN(date))::date AS from_month
+          FROM {scope}
+          GROUP BY location
+        ),
+        g AS (
+          SELECT
+            s.country_name,
+            s.month,
+            (s.month_end_total_vaccinations - LAG(s.month_end_total_vaccinations) OVER w)::double precision
+              / NULLIF(LAG(s.month_end_total_vaccinations) OVER w, 0) AS growth_rate
+          FROM country_monthly_summary s
+          JOIN touched t ON t.country_name = s.country_name
+          WHERE s.month_end_total_vaccinations IS NOT NULL
+          WINDOW w AS (PARTITION BY s.country_name ORDER BY s.month)
+        )
+        UPDATE country_monthly_summary s
+        SET growth_rate = g.growth_rate
+        FROM g
+        JOIN touched t ON t.country_name = g.country_name
+        WHERE s.country_name = g.country_name
+          AND s.month = g.month
+          AND g.month >= t.from_month;
+    """)
+    print(f"  country_monthly_summary: {months.rowcount:,} month(s) refreshed in {time.perf_counter() - t0:.2f}s")
 
-    # 5) Vaccination_by_manu
-    bm = pd.read_sql_query("SELECT * FROM Vaccination_by_manu", sq)
-    bm["date"] = bm["date"].apply(parse_ddmmyyyy_to_date)
 
+def refresh_country_quality(pg, scope: str = "vaccination"):
+    """
+    Recomputes country_quality for every country present in `scope`, in one aggregate
+    pass over their `vaccination` rows: months observed/expected, longest gap, per-column
+    null rates and date bounds (freshness). No commit.
+    """
+    t0 = time.perf_counter()
+    numeric = [name for name, pgtype in TABLES[1][2] if pgtype in ("int8", "float8")]
+    null_rates = ",\n            ".join(f"'{c}', AVG(({c} IS NULL)::int)::float8" for c in numeric)
+    span = "age(date_trunc('month', MAX(date)), date_trunc('month', MIN(date)))"
+    expected = f"(EXTRACT(YEAR FROM {span}) * 12 + EXTRACT(MONTH FROM {span}))::int + 1"
+    countries = pg.execute(f"""
+        INSERT INTO country_quality (
+          country_name, row_count, first_date, last_date,
+          observed_months, expected_months, missing_months, max_gap_days, null_rates, computed_at
+        )
+        SELECT
+          location,
+          COUNT(*),
+          MIN(date),
+          MAX(date),
+          COUNT(DISTINCT date_trunc('month', date)),
+          {expected},
+          {expected} - COUNT(DISTINCT date_trunc('month', date)),
+          MAX(gap_days),
+          jsonb_build_object(
+            {null_rates}
+          ),
+          now()
+        FROM (
+          SELECT v.*, date - LAG(date) OVER (PARTITION BY location ORDER BY date) AS gap_days
+          FROM vaccination v
+          WHERE location IN (SELECT DISTINCT location FROM {scope})
+        ) v
+        GROUP BY location
+        ON CONFLICT (country_name) DO UPDATE
+        SET row_count = EXCLUDED.row_count,
+            first_date = EXCLUDED.first_date,
+            last_date = EXCLUDED.last_date,
+            observed_months = EXCLUDED.observed_months,
+            expected_months = EXCLUDED.expected_months,
+            missing_months = EXCLUDED.missing_months,
+            max_gap_days = EXCLUDED.max_gap_days,
+            null_rates = EXCLUDED.null_rates,
+            computed_at = EXCLUDED.computed_at;
+    """)
+    print(f"  country_quality: {countries.rowcount:,} country(ies) refreshed in {time.perf_counter() - t0:.2f}s")
+
+
+def refresh_manufacturer_latest(pg, scope: str = "vaccination_by_manu"):
+    """
+    Replaces manufacturer_latest rows for every country present in `scope` with its
+    latest-date vaccination_by_manu totals. No commit.
+    """
+    t0 = time.perf_counter()
+    pg.execute(f"""
+        DELETE FROM manufacturer_latest
+        WHERE country_name IN (SELECT DISTINCT country_name FROM {scope});
+    """)
+    rows = pg.execute(f"""
+        INSERT INTO manufacturer_latest (country_name, vaccine, date, total_vaccinations)
+        SELECT m.country_name, m.vaccine, m.date, m.total_vaccinations
+        FROM vaccination_by_manu m
+        JOIN (
+          SELECT country_name, MAX(date) AS date
+          FROM vaccination_by_manu
+          WHERE country_name IN (SELECT DISTINCT country_name FROM {scope})
+          GROUP BY country_name
+        ) latest USING (country_name, date)
+        WHERE m.total_vaccinations IS NOT NULL;
+    """)
+    print(f"  manufacturer_latest: {rows.rowcount:,} row(s) refreshed in {time.perf_counter() - t0:.2f}s")
+
+
+def bump_data_version(pg):
+    """Invalidates API response caches/ETags once this transaction commits. No commit."""
+    pg.execute("UPDATE data_version SET version = version + 1, updated_at = now();")
+
+
+def record_ingest_run(pg, source: str, mode: str, results):
+    """Per-table rows/seconds of this run into ingest_run (throughput on the API's /metrics). No commit."""
     with pg.cursor() as cur:
-        for r in bm.itertuples(index=False):
-            cur.execute(
-                """
-                INSERT INTO vaccination_by_manu(date, vaccine, total_vaccinations, country_name)
-                VALUES (%s,%s,%s,%s)
-                """,
-                (r.date, r.vaccine, r.total_vaccinations, r.country_name),
-            )
-        pg.commit()
+        cur.executemany(
+            "INSERT INTO ingest_run (source, mode, table_name, rows, seconds) VALUES (%s, %s, %s, %s, %s);",
+            [(source, mode, table, n, elapsed) for table, n, elapsed in results],
+        )
+
+
+def run_incremental(sqlite_path: str, pg_dsn: str):
+    """
+    Upserts only rows newer than each country's watermark, for every table,
+    in ONE transaction: readers see the old data until the commit, never a gap.
+    """
+    sq = sqlite3.connect(sqlite_path)
+    results = []
+    changed = 0
+    with psycopg.connect(pg_dsn) as pg:
+        ensure_partitions(pg)
+        for table, source, columns in TABLES:
+            result, n_changed = upsert_table(pg, sq, table, source, columns)
+            results.append(result)
+            changed += n_changed
+            report_table(*results[-1])
+        refresh_monthly_summary(pg, scope="stage_vaccination")
+        refresh_country_quality(pg, scope="stage_vaccination")
+        refresh_manufacturer_latest(pg, scope="stage_vaccination_by_manu")
+        # A run that changed nothing keeps API caches and ETags valid
+        if changed:
+            bump_data_version(pg)
+        record_ingest_run(pg, "sqlite", "incremental", results)
+    sq.close()
+    return results
+
+
+def main():
+    sqlite_path = os.environ.get("SQLITE_PATH", "assets/Vaccinations.db")
+    pg_dsn = os.environ["PG_DSN"]
+
+    t_start = time.perf_counter()
+    if INGEST_MODE == "incremental":
+        results = run_incremental(sqlite_path, pg_dsn)
+    else:
+        results = run_full(sqlite_path, pg_dsn)
+
+    total_rows = sum(n for _, n, _ in results)
+    busy = sum(elapsed for _, _, elapsed in results)
+    elapsed = time.perf_counter() - t_start
+    print(
+        f"✅ Ingestion complete ({INGEST_MODE}): {total_rows:,} rows in {elapsed:.2f}s "
+        f"({total_rows / max(elapsed, 1e-9):,.0f} rows/s; {busy:.2f}s of table work)."
+    )
+    own, workers = peak_rss_mb()
+    print(f"   Peak RSS: {own:,.0f} MB main process, {workers:,.0f} MB largest worker (chunk size {INGEST_CHUNK_SIZE:,}).")
 
-    print("✅ Ingestion complete.")
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
     load_dotenv()
-    main()
\ No newline at end of file
+    main()
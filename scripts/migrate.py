@@ -1,31 +1,206 @@
+"""
+Applies sql/migrations/*.sql in order, each exactly once, then sql/views/*.sql.
+
+    python scripts/migrate.py              # pending migrations + new/changed views
+    python scripts/migrate.py --baseline   # record every migration as applied without running it
+                                           # (databases migrated before the ledger existed)
+
+Applied files are recorded in schema_migrations with a SHA-256 of their contents.
+Editing a migration after it was applied is an error: add a new one instead. Views
+are repeatable (CREATE OR REPLACE) and are re-applied whenever their file changes.
+
+Per-file directives, as comment lines anywhere in the file:
+    -- migrate: lock_timeout=2s            default MIGRATE_LOCK_TIMEOUT (5s)
+    -- migrate: statement_timeout=10min    default MIGRATE_STATEMENT_TIMEOUT (0 = none)
+    -- migrate: no-transaction             run statement by statement in autocommit,
+                                           e.g. for CREATE INDEX CONCURRENTLY
+A migration otherwise runs in one transaction together with its ledger row. A
+no-transaction migration is only recorded after its last statement succeeds, so its
+statements must be safe to re-run (IF NOT EXISTS, and drop an INVALID index left by a
+failed CONCURRENTLY build before retrying).
+"""
 import os
+import re
+import time
+import hashlib
+import argparse
 from pathlib import Path
 import psycopg
 
-def run_sql_file(conn, path: Path):
+SQL_DIR = Path(__file__).resolve().parents[1] / "sql"
+
+# Fail fast instead of queueing behind (and blocking) live queries for a table lock
+MIGRATE_LOCK_TIMEOUT = os.getenv("MIGRATE_LOCK_TIMEOUT", "5s")
+MIGRATE_STATEMENT_TIMEOUT = os.getenv("MIGRATE_STATEMENT_TIMEOUT", "0")
+
+LEDGER_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+  filename TEXT PRIMARY KEY,
+  kind TEXT NOT NULL,
+  checksum TEXT NOT NULL,
+  applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  duration_ms DOUBLE PRECISION
+);
+"""
+
+DIRECTIVE = re.compile(r"^--\s*migrate:\s*(.+?)\s*$", re.MULTILINE)
+DOLLAR_QUOTE = re.compile(r"\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$")
+LINE_COMMENT = re.compile(r"--[^\n]*")
+
+
+def checksum(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def directives(sql: str):
+    """{"lock_timeout": ..., "statement_timeout": ..., "transaction": bool} for one file."""
+    found = {
+        "lock_timeout": MIGRATE_LOCK_TIMEOUT,
+        "statement_timeout": MIGRATE_STATEMENT_TIMEOUT,
+        "transaction": True,
+    }
+    for line in DIRECTIVE.findall(sql):
+        for item in line.split(","):
+            key, _, value = item.strip().partition("=")
+            if key == "no-transaction":
+                found["transaction"] = False
+            elif key in ("lock_timeout", "statement_timeout") and value:
+                found[key] = value.strip()
+            else:
+                raise RuntimeError(f"Unknown migrate directive: {item.strip()!r}")
+    return found
+
+
+def split_statements(sql: str):
+    """Top-level statements of a script; quotes, $$ bodies and comments are respected."""
+    statements, start, i, n = [], 0, 0, len(sql)
+    while i < n:
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end < 0 else end
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+        elif sql[i] in "'\"":
+            quote, i = sql[i], i + 1
+            while i < n and not (sql[i] == quote and sql[i + 1:i + 2] != quote):
+                i += 2 if sql[i] == quote else 1
+            i += 1
+        elif (m := DOLLAR_QUOTE.match(sql, i)) is not None:
+            end = sql.find(m.group(0), m.end())
+            i = n if end < 0 else end + len(m.group(0))
+        elif sql[i] == ";":
+            statements.append(sql[start:i + 1])
+            start = i = i + 1
+        else:
+            i += 1
+    statements.append(sql[start:])
+    return [s.strip() for s in statements if LINE_COMMENT.sub("", s).strip(" \t\r\n;")]
+
+
+def _set_timeouts(conn, options, local: bool):
+    conn.execute(
+        "SELECT set_config('lock_timeout', %s, %s), set_config('statement_timeout', %s, %s);",
+        (options["lock_timeout"], local, options["statement_timeout"], local),
+    )
+
+
+def _record(conn, name: str, kind: str, digest: str, elapsed):
+    conn.execute("""
+        INSERT INTO schema_migrations (filename, kind, checksum, duration_ms)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (filename) DO UPDATE
+        SET checksum = EXCLUDED.checksum, applied_at = now(), duration_ms = EXCLUDED.duration_ms;
+    """, (name, kind, digest, None if elapsed is None else elapsed * 1000))
+
+
+def apply_file(conn, path: Path, kind: str, digest: str) -> float:
+    """Runs one file (per its directives) and records it in the ledger. Returns seconds."""
     sql = path.read_text(encoding="utf-8")
-    with conn.cursor() as cur:
-        cur.execute(sql)
+    options = directives(sql)
+    name = str(path.relative_to(SQL_DIR))
+    t0 = time.perf_counter()
+    if options["transaction"]:
+        with conn.transaction():
+            _set_timeouts(conn, options, local=True)
+            conn.execute(sql)
+            _record(conn, name, kind, digest, time.perf_counter() - t0)
+    else:
+        _set_timeouts(conn, options, local=False)
+        try:
+            for statement in split_statements(sql):
+                conn.execute(statement)
+        finally:
+            conn.execute("RESET lock_timeout; RESET statement_timeout;")
+        _record(conn, name, kind, digest, time.perf_counter() - t0)
+    return time.perf_counter() - t0
+
+
+def migrate(conn, baseline: bool = False, log=print):
+    """
+    Applies pending migrations and changed views on an autocommit connection, holding an
+    advisory lock so concurrent deploys run one after the other. Returns [(file, seconds)].
+    """
+    conn.execute("SELECT pg_advisory_lock(hashtext('vaxpulse.migrate'));")
+    try:
+        # Under the lock: concurrent CREATE TABLE IF NOT EXISTS can still collide on the catalog
+        conn.execute(LEDGER_DDL)
+        applied = dict(conn.execute("SELECT filename, checksum FROM schema_migrations;").fetchall())
+        migrations = sorted((SQL_DIR / "migrations").glob("*.sql"))
+        if not migrations:
+            raise RuntimeError("No migration files found in sql/migrations/")
+
+        edited = [
+            str(p.relative_to(SQL_DIR)) for p in migrations
+            if applied.get(str(p.relative_to(SQL_DIR)), checksum(p)) != checksum(p)
+        ]
+        if edited and not baseline:
+            raise RuntimeError(f"Applied migrations were edited afterwards: {', '.join(edited)}. Add a new migration instead.")
+
+        ran = []
+        for path in migrations:
+            name, digest = str(path.relative_to(SQL_DIR)), checksum(path)
+            if name in applied and not baseline:
+                continue
+            if baseline:
+                _record(conn, name, "migration", digest, None)
+                log(f"  baselined {name}")
+                continue
+            log(f"  applying {name} ...")
+            ran.append((name, apply_file(conn, path, "migration", digest)))
+            log(f"  applied {name} in {ran[-1][1]:.2f}s")
+
+        for path in sorted((SQL_DIR / "views").glob("*.sql")):
+            name, digest = str(path.relative_to(SQL_DIR)), checksum(path)
+            if applied.get(name) == digest:
+                continue
+            ran.append((name, apply_file(conn, path, "view", digest)))
+            log(f"  applied {name} in {ran[-1][1]:.2f}s")
+        return ran
+    finally:
+        conn.execute("SELECT pg_advisory_unlock(hashtext('vaxpulse.migrate'));")
+
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", action="store_true", help="mark all migrations as applied without running them")
+    args = parser.parse_args()
+
     dsn = os.environ.get("PG_DSN")
     if not dsn:
         raise RuntimeError("PG_DSN env var not set. Add it in Render Environment settings.")
 
-    migrations_dir = Path("sql/migrations")
-    files = sorted(migrations_dir.glob("*.sql"))
-
-    if not files:
-        raise RuntimeError("No migration files found in sql/migrations/")
+    t0 = time.perf_counter()
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        ran = migrate(conn, baseline=args.baseline)
 
-    with psycopg.connect(dsn) as conn:
-        # Ensure idempotent / safe re-runs by using IF NOT EXISTS in SQL
-        for f in files:
-            print(f"Applying migration: {f}")
-            run_sql_file(conn, f)
-        conn.commit()
+    if args.baseline:
+        print(f"✅ Migrations baselined in {time.perf_counter() - t0:.2f}s.")
+    elif ran:
+        print(f"✅ Applied {len(ran)} file(s) in {time.perf_counter() - t0:.2f}s.")
+    else:
+        print("✅ Database is up to date.")
 
-    print("✅ Migrations applied successfully.")
 
 if __name__ == "__main__":
     main()
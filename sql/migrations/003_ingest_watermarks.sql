@@ -0,0 +1,10 @@
+-- 003_ingest_watermarks.sql
+-- Per-table, per-country high-water mark of loaded dates (incremental ingestion)
+
+CREATE TABLE IF NOT EXISTS ingest_watermark (
+  table_name TEXT NOT NULL,
+  country_name TEXT NOT NULL,
+  last_date DATE NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (table_name, country_name)
+);
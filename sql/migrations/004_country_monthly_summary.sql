@@ -0,0 +1,35 @@
+-- 004_country_monthly_summary.sql
+-- Materialized month-end totals + MoM growth per country.
+-- Maintained by ingestion for the (country, month) pairs it touched; read by the API and KPI views.
+
+CREATE TABLE IF NOT EXISTS country_monthly_summary (
+  country_name TEXT NOT NULL REFERENCES location(country_name) ON DELETE CASCADE,
+  month DATE NOT NULL,
+  month_end_total_vaccinations BIGINT,
+  growth_rate DOUBLE PRECISION,
+  daily_rows INTEGER NOT NULL,
+  PRIMARY KEY (country_name, month)
+);
+
+-- Backfill from existing daily rows
+INSERT INTO country_monthly_summary (country_name, month, month_end_total_vaccinations, daily_rows)
+SELECT location, date_trunc('month', date)::date, MAX(total_vaccination), COUNT(*)
+FROM vaccination
+GROUP BY 1, 2
+ON CONFLICT (country_name, month) DO NOTHING;
+
+WITH g AS (
+  SELECT
+    country_name,
+    month,
+    (month_end_total_vaccinations - LAG(month_end_total_vaccinations) OVER w)::double precision
+      / NULLIF(LAG(month_end_total_vaccinations) OVER w, 0) AS growth_rate
+  FROM country_monthly_summary
+  WHERE month_end_total_vaccinations IS NOT NULL
+  WINDOW w AS (PARTITION BY country_name ORDER BY month)
+)
+UPDATE country_monthly_summary s
+SET growth_rate = g.growth_rate
+FROM g
+WHERE s.country_name = g.country_name AND s.month = g.month
+  AND s.growth_rate IS DISTINCT FROM g.growth_rate;
@@ -0,0 +1,54 @@
+-- 005_country_quality.sql
+-- Per-country data-quality profile of `vaccination`, computed in one aggregate pass.
+-- Maintained by ingestion for the countries it touched; read by /quality/*.
+
+CREATE TABLE IF NOT EXISTS country_quality (
+  country_name TEXT PRIMARY KEY REFERENCES location(country_name) ON DELETE CASCADE,
+  row_count INTEGER NOT NULL,
+  first_date DATE,
+  last_date DATE,
+  observed_months INTEGER NOT NULL,
+  expected_months INTEGER NOT NULL,
+  missing_months INTEGER NOT NULL,
+  max_gap_days INTEGER,
+  null_rates JSONB NOT NULL,           -- {column: share of rows where it is NULL}
+  computed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Backfill from existing daily rows (same pass ingestion runs)
+INSERT INTO country_quality (
+  country_name, row_count, first_date, last_date,
+  observed_months, expected_months, missing_months, max_gap_days, null_rates
+)
+SELECT
+  location,
+  COUNT(*),
+  MIN(date),
+  MAX(date),
+  COUNT(DISTINCT date_trunc('month', date)),
+  (EXTRACT(YEAR FROM age(date_trunc('month', MAX(date)), date_trunc('month', MIN(date)))) * 12
+   + EXTRACT(MONTH FROM age(date_trunc('month', MAX(date)), date_trunc('month', MIN(date)))))::int + 1,
+  (EXTRACT(YEAR FROM age(date_trunc('month', MAX(date)), date_trunc('month', MIN(date)))) * 12
+   + EXTRACT(MONTH FROM age(date_trunc('month', MAX(date)), date_trunc('month', MIN(date)))))::int + 1
+   - COUNT(DISTINCT date_trunc('month', date)),
+  MAX(gap_days),
+  jsonb_build_object(
+    'total_vaccination', AVG((total_vaccination IS NULL)::int)::float8,
+    'people_vaccinated', AVG((people_vaccinated IS NULL)::int)::float8,
+    'people_fully_vaccinated', AVG((people_fully_vaccinated IS NULL)::int)::float8,
+    'total_boosters', AVG((total_boosters IS NULL)::int)::float8,
+    'daily_vaccinations_raw', AVG((daily_vaccinations_raw IS NULL)::int)::float8,
+    'daily_vaccination', AVG((daily_vaccination IS NULL)::int)::float8,
+    'total_vaccination_per_hundred', AVG((total_vaccination_per_hundred IS NULL)::int)::float8,
+    'people_vaccinated_per_hundred', AVG((people_vaccinated_per_hundred IS NULL)::int)::float8,
+    'people_fully_vaccinated_per_hundred', AVG((people_fully_vaccinated_per_hundred IS NULL)::int)::float8,
+    'daily_vaccination_per_million', AVG((daily_vaccination_per_million IS NULL)::int)::float8,
+    'daily_people_vaccinated', AVG((daily_people_vaccinated IS NULL)::int)::float8,
+    'daily_people_vaccinated_per_hundred', AVG((daily_people_vaccinated_per_hundred IS NULL)::int)::float8
+  )
+FROM (
+  SELECT v.*, date - LAG(date) OVER (PARTITION BY location ORDER BY date) AS gap_days
+  FROM vaccination v
+) v
+GROUP BY location
+ON CONFLICT (country_name) DO NOTHING;
@@ -0,0 +1,29 @@
+-- 006_manufacturer_latest.sql
+-- Latest-date manufacturer totals per country, maintained by ingestion,
+-- plus a (country, date DESC) access path for per-country manufacturer history.
+
+CREATE INDEX IF NOT EXISTS idx_vbm_country_date
+  ON vaccination_by_manu (country_name, date DESC) INCLUDE (vaccine, total_vaccinations);
+
+-- Superseded by idx_vbm_country_date (same leading column)
+DROP INDEX IF EXISTS idx_vbm_country;
+
+CREATE TABLE IF NOT EXISTS manufacturer_latest (
+  country_name TEXT NOT NULL REFERENCES location(country_name) ON DELETE CASCADE,
+  vaccine TEXT NOT NULL,
+  date DATE NOT NULL,
+  total_vaccinations BIGINT NOT NULL,
+  PRIMARY KEY (country_name, vaccine)
+);
+
+-- Backfill from existing rows
+INSERT INTO manufacturer_latest (country_name, vaccine, date, total_vaccinations)
+SELECT m.country_name, m.vaccine, m.date, m.total_vaccinations
+FROM vaccination_by_manu m
+JOIN (
+  SELECT country_name, MAX(date) AS date
+  FROM vaccination_by_manu
+  GROUP BY country_name
+) latest USING (country_name, date)
+WHERE m.total_vaccinations IS NOT NULL
+ON CONFLICT (country_name, vaccine) DO NOTHING;
@@ -0,0 +1,11 @@
+-- 007_data_version.sql
+-- Single-row counter bumped by every ingestion run; the API folds it into
+-- its response-cache key and ETags.
+
+CREATE TABLE IF NOT EXISTS data_version (
+  id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+  version BIGINT NOT NULL DEFAULT 1,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO data_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,146 @@
+-- 008_partition_fact_tables.sql
+-- Declarative partitioning for the daily fact tables (vaccination, country_data,
+-- vaccination_by_manu): yearly RANGE partitions on date, optionally HASH
+-- sub-partitioned on the country column, plus BRIN indexes on date.
+--
+-- Hash sub-partitions are opt-in and fixed at conversion time:
+--   PGOPTIONS="-c vaxpulse.location_hash_partitions=8" python scripts/migrate.py
+--
+-- Idempotent: tables that are already partitioned are left alone. Ingestion calls
+-- vaxpulse_ensure_partitions() so new years get their own partition; rows outside
+-- every yearly range land in <table>_default.
+--
+-- MAINTENANCE WINDOW ONLY. Converting a table copies every row while holding ACCESS
+-- EXCLUSIVE on vaccination, country_data and vaccination_by_manu, so API reads of
+-- them block until the migration commits (expect roughly the time of a full ingestion
+-- run). Stop the API or put it in maintenance mode first. statement_timeout bounds the
+-- copy: past it the transaction rolls back and the tables stay unpartitioned.
+-- migrate: lock_timeout=5s, statement_timeout=30min
+
+CREATE TABLE IF NOT EXISTS partition_config (
+  table_name TEXT PRIMARY KEY,
+  country_column TEXT NOT NULL,
+  hash_partitions INTEGER NOT NULL DEFAULT 0
+);
+
+-- Creates the yearly partitions of `p_table` covering [p_from, p_to]
+CREATE OR REPLACE FUNCTION vaxpulse_create_year_partitions(p_table TEXT, p_from DATE, p_to DATE)
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+  cfg partition_config%ROWTYPE;
+  y INTEGER;
+  part TEXT;
+  i INTEGER;
+BEGIN
+  SELECT * INTO cfg FROM partition_config WHERE table_name = p_table;
+  FOR y IN EXTRACT(YEAR FROM p_from)::int .. EXTRACT(YEAR FROM p_to)::int LOOP
+    part := format('%s_y%s', p_table, y);
+    CONTINUE WHEN to_regclass(part) IS NOT NULL;
+    BEGIN
+      IF cfg.hash_partitions > 0 THEN
+        EXECUTE format(
+          'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L) PARTITION BY HASH (%I)',
+          part, p_table, make_date(y, 1, 1), make_date(y + 1, 1, 1), cfg.country_column
+        );
+        FOR i IN 0 .. cfg.hash_partitions - 1 LOOP
+          EXECUTE format(
+            'CREATE TABLE %I PARTITION OF %I FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+            format('%s_h%s', part, i), part, cfg.hash_partitions, i
+          );
+        END LOOP;
+      ELSE
+        EXECUTE format(
+          'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+          part, p_table, make_date(y, 1, 1), make_date(y + 1, 1, 1)
+        );
+      END IF;
+    EXCEPTION WHEN check_violation THEN
+      -- <table>_default already holds rows for this year; leave them there
+      RAISE NOTICE 'partition % not created: %_default has rows in its range', part, p_table;
+    END;
+  END LOOP;
+END;
+$$;
+
+-- Yearly partitions for every partitioned fact table, [p_from, p_to]
+CREATE OR REPLACE FUNCTION vaxpulse_ensure_partitions(p_from DATE, p_to DATE)
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+  t TEXT;
+BEGIN
+  FOR t IN SELECT table_name FROM partition_config LOOP
+    PERFORM vaxpulse_create_year_partitions(t, p_from, p_to);
+  END LOOP;
+END;
+$$;
+
+DO $$
+DECLARE
+  spec RECORD;
+  hash_n INTEGER := COALESCE(NULLIF(current_setting('vaxpulse.location_hash_partitions', true), ''), '0')::int;
+  lo DATE;
+  hi DATE;
+BEGIN
+  FOR spec IN
+    SELECT * FROM (VALUES
+      ('vaccination', 'location', 'date, location'),
+      ('country_data', 'country_name', 'country_name, date, vaccine'),
+      ('vaccination_by_manu', 'country_name', 'country_name, date, vaccine')
+    ) AS s(tbl, country_col, pk)
+  LOOP
+    CONTINUE WHEN (SELECT relkind FROM pg_class WHERE oid = spec.tbl::regclass) = 'p';
+
+    INSERT INTO partition_config (table_name, country_column, hash_partitions)
+    VALUES (spec.tbl, spec.country_col, hash_n)
+    ON CONFLICT (table_name) DO UPDATE SET hash_partitions = EXCLUDED.hash_partitions;
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', spec.tbl, spec.tbl || '_unpartitioned');
+    EXECUTE format(
+      'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (date)',
+      spec.tbl, spec.tbl || '_unpartitioned'
+    );
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', spec.tbl || '_default', spec.tbl);
+
+    EXECUTE format('SELECT MIN(date), MAX(date) FROM %I', spec.tbl || '_unpartitioned') INTO lo, hi;
+    PERFORM vaxpulse_create_year_partitions(
+      spec.tbl,
+      LEAST(COALESCE(lo, CURRENT_DATE), DATE '2020-01-01'),
+      GREATEST(COALESCE(hi, CURRENT_DATE), CURRENT_DATE + 365)
+    );
+
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', spec.tbl, spec.tbl || '_unpartitioned');
+    EXECUTE format('DROP TABLE %I', spec.tbl || '_unpartitioned');
+
+    -- Keys/indexes after the copy (the old table's names are free again)
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (%s)', spec.tbl, spec.pk);
+    EXECUTE format(
+      'ALTER TABLE %I ADD FOREIGN KEY (%I) REFERENCES location(country_name)',
+      spec.tbl, spec.country_col
+    );
+  END LOOP;
+END;
+$$;
+
+-- Indexes on the partitioned parents cascade to every partition.
+-- BRIN on date: tiny, and date-ordered loads keep it selective for range scans.
+CREATE INDEX IF NOT EXISTS idx_vaccination_location_date ON vaccination (location, date);
+CREATE INDEX IF NOT EXISTS idx_vaccination_date_brin ON vaccination USING brin (date);
+CREATE INDEX IF NOT EXISTS idx_country_data_date_brin ON country_data USING brin (date);
+CREATE INDEX IF NOT EXISTS idx_vbm_country_date
+  ON vaccination_by_manu (country_name, date DESC) INCLUDE (vaccine, total_vaccinations);
+-- 001 recreates idx_vbm_date (B-tree) if it is missing, so the BRIN index keeps that name.
+-- This relname check matches an idx_vbm_date in any schema; 010_vbm_date_brin.sql redoes
+-- it for the migrated schema only.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    JOIN pg_am am ON am.oid = i.relam
+    WHERE i.relname = 'idx_vbm_date' AND am.amname <> 'brin'
+  ) THEN
+    DROP INDEX idx_vbm_date;
+  END IF;
+END;
+$$;
+CREATE INDEX IF NOT EXISTS idx_vbm_date ON vaccination_by_manu USING brin (date);
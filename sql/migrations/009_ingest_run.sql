@@ -0,0 +1,16 @@
+-- 009_ingest_run.sql
+-- Per-table outcome of every ingestion run; the API exports the latest run per
+-- (source, mode, table) as throughput gauges on /metrics.
+
+CREATE TABLE IF NOT EXISTS ingest_run (
+  id BIGSERIAL PRIMARY KEY,
+  source TEXT NOT NULL,
+  mode TEXT NOT NULL,
+  table_name TEXT NOT NULL,
+  rows BIGINT NOT NULL,
+  seconds DOUBLE PRECISION NOT NULL,
+  finished_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ingest_run_latest
+  ON ingest_run (source, mode, table_name, finished_at DESC);
@@ -0,0 +1,17 @@
+-- 010_vbm_date_brin.sql
+-- Makes sure idx_vbm_date on vaccination_by_manu is the BRIN index 008 intended.
+-- 008 checks the index type by name in every schema, so in a database with several
+-- schemas (e.g. the benchmark's) its outcome here depended on the others. to_regclass
+-- resolves the name through search_path: only this schema's index is looked at.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_class i
+    JOIN pg_am am ON am.oid = i.relam
+    WHERE i.oid = to_regclass('idx_vbm_date') AND am.amname <> 'brin'
+  ) THEN
+    DROP INDEX idx_vbm_date;
+  END IF;
+END;
+$$;
+CREATE INDEX IF NOT EXISTS idx_vbm_date ON vaccination_by_manu USING brin (date);
@@ -0,0 +1,30 @@
+-- 011_non_country_location.sql
+-- Locations that are not countries on the world map: OWID aggregates (World, continents,
+-- income groups) and places without an ISO 3166 code. OWID gives all of them an
+-- OWID_* iso code; the OWID CSV ingester records any new ones it skips.
+
+CREATE TABLE IF NOT EXISTS non_country_location (
+  country_name TEXT PRIMARY KEY,
+  iso_code TEXT NOT NULL
+);
+
+INSERT INTO non_country_location (country_name, iso_code) VALUES
+  ('World', 'OWID_WRL'),
+  ('Africa', 'OWID_AFR'),
+  ('Asia', 'OWID_ASI'),
+  ('Europe', 'OWID_EUR'),
+  ('European Union', 'OWID_EUN'),
+  ('North America', 'OWID_NAM'),
+  ('Oceania', 'OWID_OCE'),
+  ('South America', 'OWID_SAM'),
+  ('High income', 'OWID_HIC'),
+  ('Upper middle income', 'OWID_UMC'),
+  ('Lower middle income', 'OWID_LMC'),
+  ('Low income', 'OWID_LIC'),
+  ('England', 'OWID_ENG'),
+  ('Scotland', 'OWID_SCT'),
+  ('Wales', 'OWID_WLS'),
+  ('Northern Ireland', 'OWID_NIR'),
+  ('Kosovo', 'OWID_KOS'),
+  ('Northern Cyprus', 'OWID_CYN')
+ON CONFLICT (country_name) DO NOTHING;
@@ -1,13 +1,15 @@
 -- Monthly totals per country (for growth analytics)
+-- Backed by country_monthly_summary, which ingestion keeps up to date
 CREATE OR REPLACE VIEW vw_country_monthly_totals AS
 SELECT
-  location AS country_name,
-  date_trunc('month', date)::date AS month,
-  MAX(total_vaccination) AS month_end_total_vaccinations
-FROM vaccination
-GROUP BY location, date_trunc('month', date);
+  country_name,
+  month,
+  month_end_total_vaccinations
+FROM country_monthly_summary;
 
 -- Monthly growth rate (MoM) per country
+-- LAG over every month with daily rows, so a month after one without a total has no
+-- growth. (country_monthly_summary.growth_rate, served by the API, skips such months.)
 CREATE OR REPLACE VIEW vw_country_monthly_growth AS
 SELECT
   country_name,